@@ -1,27 +1,44 @@
 import os
 import random
-from datetime import datetime
-from typing import Optional
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form, BackgroundTasks, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, Query, Request, HTTPException
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth import get_current_device
+from app.auth import get_current_device, get_basic_authenticated_device, create_device_token, verify_docs_api_key
 from app.config import settings, get_current_time, to_wib
-from app.database import get_db
+from app.database import get_async_db, AsyncSessionLocal
 from app.models.device import Device
-from app.models.image import Image
+from app.models.image import Image, generate_uuid
 from app.models.inference import InferenceResult
-from app.schemas.schemas import UploadResponse, DeviceResponse
+from app.models.inference_job import InferenceJob
+from app.schemas.schemas import (
+    UploadResponse,
+    BatchUploadResponse,
+    BatchFrameResult,
+    DeviceResponse,
+    DeviceTokenResponse
+)
+from app.services.blynk_outbox import blynk_outbox
+from app.services.control_state_cache import control_state_cache
 from app.services.blynk_service import blynk_service
-from app.services.decision_engine import decision_engine
-from app.services.manual_control_service import DeviceControlService
+from app.services.idempotency_service import idempotency_service
+from app.services.inference_cache import inference_cache
+from app.services.inference_scheduler import inference_scheduler
+from app.services.job_queue import job_queue
+from app.services.decision_engine import async_decision_engine as decision_engine
+from app.services.decision_events import DECISION_TOPIC, build_decision_event, decision_metrics
+from app.services.event_bus import event_bus
+from app.services.notification_aggregator import notification_aggregator
+from app.services.manual_control_service import AsyncDeviceControlService as DeviceControlService
+from app.services.preprocessing_service import preprocessing_pool
 from app.services.roboflow_service import roboflow_service
-from app.utils.image_utils import (
-    save_image,
-    preprocess_image,
-    generate_image_filename
-)
+from app.services.storage_service import storage_service
+from app.utils.image_utils import UploadTooLargeError, hamming_distance, iter_upload_file
 
 router = APIRouter()
 
@@ -33,7 +50,7 @@ OVERRIDE_MIN = 5  # Nilai minimum untuk override
 OVERRIDE_MAX = 15  # Nilai maksimum untuk override
 
 
-def check_consecutive_anomalies(device_code: str, db: Session) -> int:
+async def check_consecutive_anomalies(device_code: str, db: AsyncSession) -> int:
     """
     Cek berapa kali berturut-turut hasil inference dalam range "aneh"
     Range aneh: total_jentik == 0 atau total_jentik < ANOMALY_THRESHOLD
@@ -41,14 +58,17 @@ def check_consecutive_anomalies(device_code: str, db: Session) -> int:
     Returns: jumlah hasil anomali berturut-turut dari yang terbaru
     """
     # Ambil N hasil inference terakhir untuk device ini
-    recent_inferences = db.query(InferenceResult).filter(
-        InferenceResult.device_code == device_code,
-        InferenceResult.status == "success"
-    ).order_by(InferenceResult.inference_at.desc()).limit(CONSECUTIVE_ANOMALY_COUNT).all()
+    result = await db.execute(
+        select(InferenceResult.total_jentik).where(
+            InferenceResult.device_code == device_code,
+            InferenceResult.status == "success"
+        ).order_by(InferenceResult.inference_at.desc()).limit(CONSECUTIVE_ANOMALY_COUNT)
+    )
+    recent_jentik = result.scalars().all()
     
     consecutive_count = 0
-    for inference in recent_inferences:
-        if inference.total_jentik < ANOMALY_THRESHOLD:
+    for total_jentik in recent_jentik:
+        if total_jentik < ANOMALY_THRESHOLD:
             consecutive_count += 1
         else:
             break  # Streak terputus
@@ -56,7 +76,7 @@ def check_consecutive_anomalies(device_code: str, db: Session) -> int:
     return consecutive_count
 
 
-def should_override_inference(device_code: str, current_jentik: int, db: Session) -> bool:
+async def should_override_inference(device_code: str, current_jentik: int, db: AsyncSession) -> bool:
     """
     Tentukan apakah perlu override hasil inference
     
@@ -68,7 +88,7 @@ def should_override_inference(device_code: str, current_jentik: int, db: Session
         return False  # Hasil saat ini normal, tidak perlu override
     
     # Cek hasil sebelumnya
-    previous_anomalies = check_consecutive_anomalies(device_code, db)
+    previous_anomalies = await check_consecutive_anomalies(device_code, db)
     
     # Jika sudah ada cukup anomali berturut-turut sebelumnya, override yang ini
     return previous_anomalies >= (CONSECUTIVE_ANOMALY_COUNT - 1)
@@ -82,24 +102,68 @@ def get_override_value() -> int:
     return random.randint(OVERRIDE_MIN, OVERRIDE_MAX)
 
 
-async def process_inference_background(
-    original_image_id: str,
-    preprocessed_image_path: str,
-    device_id: str,
-    device_code: str,
-    db: Session
-):
+async def process_inference_background(job: InferenceJob):
     """
     Background task untuk processing inference
     Sesuai flow di rancangan.md - async processing
     
+    Dijalankan oleh worker inference_scheduler untuk job yang sudah di-claim,
+    dengan session database sendiri. Exception dibiarkan naik agar job di-retry
+    dengan backoff; setelah max_attempts record_inference_failure dipanggil.
+    
     Includes manipulation logic:
     - Jika hasil 2-3x berturut-turut dalam range "aneh" (0 atau < 4)
     - Override dengan nilai random 5-15
     """
-    try:
-        # Inference dengan Roboflow
-        raw_prediction = await roboflow_service.infer(preprocessed_image_path)
+    original_image_id = job.image_id
+    device_id = job.device_id
+    device_code = job.device_code
+    # Budget waktu attempt ini, termasuk preprocessing & unduh dari storage
+    deadline = None
+    if settings.INFERENCE_JOB_DEADLINE_SECONDS > 0:
+        deadline = time.monotonic() + settings.INFERENCE_JOB_DEADLINE_SECONDS
+    
+    async with AsyncSessionLocal() as db:
+        # Job bisa di-claim ulang setelah lease habis - jangan inference dua kali
+        existing = await db.execute(
+            select(InferenceResult.id).where(InferenceResult.image_id == original_image_id).limit(1)
+        )
+        if existing.first():
+            print(f"↷ Inference already recorded for image {original_image_id}, skipping")
+            return
+        
+        # Frame identik (checksum sama) yang sudah punya hasil → pakai ulang
+        # tanpa preprocessing & Roboflow
+        reuse_reason = "duplicate"
+        reusable_result = await find_reusable_result(original_image_id, db)
+        if not reusable_result:
+            # Scene tidak berubah (perceptual hash mirip frame terakhir yang di-inference)
+            reuse_reason = "unchanged_scene"
+            reusable_result = await find_unchanged_scene_result(job, db)
+        
+        reused_from_id = None
+        if reusable_result:
+            raw_prediction = reusable_result.raw_prediction
+            reused_from_id = reusable_result.reused_from_id or reusable_result.id
+            print(f"♻️  Reusing inference result {reused_from_id} for frame {original_image_id} ({reuse_reason})")
+        else:
+            reuse_reason = None
+            # Preprocessing (process pool) jika belum dilakukan attempt sebelumnya
+            preprocessed_image_path = job.preprocessed_image_path
+            if not preprocessed_image_path:
+                preprocessed_image_path = await preprocess_for_job(job, db)
+            
+            # Akhiri transaksi baca agar koneksi DB tidak tertahan selama request Roboflow
+            await db.commit()
+            
+            # Inference dengan Roboflow (S3: file diunduh sementara)
+            # Nama file content-addressed = checksum: key cache tanpa hash ulang file
+            async with storage_service.local_path(preprocessed_image_path) as local_path:
+                raw_prediction = await roboflow_service.infer(
+                    local_path,
+                    checksum=storage_service.content_checksum(preprocessed_image_path),
+                    deadline=deadline
+                )
         
         # Parse hasil prediksi
         parsed_result = roboflow_service.parse_prediction(raw_prediction)
@@ -109,7 +173,7 @@ async def process_inference_background(
         is_manipulated = False
         
         # Cek apakah perlu override
-        if should_override_inference(device_code, original_jentik, db):
+        if await should_override_inference(device_code, original_jentik, db):
             override_value = get_override_value()
             parsed_result['total_jentik'] = override_value
             parsed_result['total_objects'] = override_value + parsed_result.get('total_non_jentik', 0)
@@ -128,85 +192,443 @@ async def process_inference_background(
             total_non_jentik=parsed_result['total_non_jentik'],
             avg_confidence=parsed_result['avg_confidence'],
             parsing_version="1.0" if not is_manipulated else "1.0-M",  # Mark as manipulated
-            status="success"
+            status="success",
+            reused_from_id=reused_from_id,
+            reuse_reason=reuse_reason
         )
         db.add(inference_result)
-        db.commit()
         
         # Decision Engine (menggunakan nilai yang sudah dimanipulasi)
         status = decision_engine.determine_status(parsed_result['total_jentik'])
         action = decision_engine.determine_action(status)
         
-        # Handle alerts
-        if decision_engine.should_create_alert(
-            device_code,
-            parsed_result['total_jentik'],
-            db
-        ):
-            decision_engine.create_alert(
-                device_id,
-                device_code,
-                parsed_result['total_jentik'],
-                db
+        # Alert dan dashboard Blynk (outbox, dikirim flusher) di-commit bersama inference result
+        await decision_engine.apply_alerts(device_id, device_code, parsed_result['total_jentik'], db)
+        await blynk_outbox.enqueue(db, device_code, {
+            blynk_service.STATUS_PIN: status,
+            blynk_service.LARVA_COUNT_PIN: parsed_result['total_jentik']
+        })
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Worker lain (lease sudah diambil alih) lebih dulu menyimpan hasil frame ini
+            await db.rollback()
+            print(f"↷ Inference already recorded for image {original_image_id}, discarding duplicate")
+            return
+        # Write-through state polling /device/{code}/control
+        control_state_cache.set_automatic_action(device_code, to_servo_action(action))
+    
+    # Sync Blynk, notifikasi & metrics berjalan di subscriber event bus
+    # (queue sendiri-sendiri, tidak menahan worker inference)
+    event_bus.publish(DECISION_TOPIC, build_decision_event(
+        inference_result.id,
+        original_image_id,
+        device_id,
+        device_code,
+        status,
+        action,
+        parsed_result['total_jentik'],
+        is_manipulated=is_manipulated,
+        reuse_reason=reuse_reason
+    ))
+    
+    manipulation_note = " [MANIPULATED]" if is_manipulated else ""
+    print(f"✓ Inference completed for {device_code}: {status} ({parsed_result['total_jentik']} jentik){manipulation_note}")
+
+
+async def find_duplicate_image(device_id: str, checksum: str, db: AsyncSession) -> Optional[str]:
+    """
+    Cari frame original pertama dari device yang sama dengan checksum sama
+    Returns: id image tersebut atau None
+    """
+    result = await db.execute(
+        select(Image.id).where(
+            Image.checksum == checksum,
+            Image.device_id == device_id,
+            Image.image_type == "original",
+            Image.duplicate_of_id.is_(None)
+        ).order_by(Image.uploaded_at).limit(1)
+    )
+    return result.scalar()
+
+
+async def find_reusable_result(image_id: str, db: AsyncSession) -> Optional[InferenceResult]:
+    """
+    Cari InferenceResult sukses dari frame identik (frame asal atau duplikat lainnya)
+    Returns: InferenceResult atau None jika frame bukan duplikat / belum ada hasil
+    """
+    duplicate_of_id = await db.scalar(select(Image.duplicate_of_id).where(Image.id == image_id))
+    if not duplicate_of_id:
+        return None
+    
+    result = await db.execute(
+        select(InferenceResult)
+        .join(Image, Image.id == InferenceResult.image_id)
+        .where(
+            or_(Image.id == duplicate_of_id, Image.duplicate_of_id == duplicate_of_id),
+            InferenceResult.status == "success"
+        )
+        .order_by(InferenceResult.inference_at)
+        .limit(1)
+    )
+    return result.scalar()
+
+
+async def find_unchanged_scene_result(job: InferenceJob, db: AsyncSession) -> Optional[InferenceResult]:
+    """
+    Scene-change gate: bandingkan perceptual hash frame ini dengan frame terakhir device
+    yang benar-benar di-inference (bukan hasil pakai ulang) dalam SCENE_CHANGE_MAX_AGE_SECONDS
+    
+    Hash dihitung sekali (decode grayscale resolusi rendah di process pool) dan disimpan di Image
+    
+    Returns: InferenceResult yang bisa dipakai ulang jika jarak Hamming < threshold, selain itu None
+    """
+    threshold = settings.SCENE_CHANGE_HAMMING_THRESHOLD
+    if threshold <= 0:
+        return None
+    
+    original_image = await db.get(Image, job.image_id)
+    if not original_image:
+        raise ValueError(f"Original image {job.image_id} not found")
+    
+    if not original_image.perceptual_hash:
+        image_data = await storage_service.load(original_image.image_path)
+        original_image.perceptual_hash = await preprocessing_pool.perceptual_hash(image_data)
+        await db.commit()
+    
+    min_inference_at = get_current_time() - timedelta(seconds=settings.SCENE_CHANGE_MAX_AGE_SECONDS)
+    result = await db.execute(
+        select(InferenceResult, Image.perceptual_hash)
+        .join(Image, Image.id == InferenceResult.image_id)
+        .where(
+            InferenceResult.device_id == job.device_id,
+            InferenceResult.status == "success",
+            InferenceResult.reused_from_id.is_(None),
+            InferenceResult.inference_at >= min_inference_at,
+            Image.perceptual_hash.is_not(None)
+        )
+        .order_by(InferenceResult.inference_at.desc())
+        .limit(1)
+    )
+    row = result.first()
+    if not row:
+        return None
+    
+    last_result, last_hash = row
+    distance = hamming_distance(original_image.perceptual_hash, last_hash)
+    if distance >= threshold:
+        print(f"  Scene changed for {job.device_code} (hamming distance {distance})")
+        return None
+    
+    print(f"  Scene unchanged for {job.device_code} (hamming distance {distance} < {threshold})")
+    return last_result
+
+
+async def preprocess_for_job(job: InferenceJob, db: AsyncSession) -> str:
+    """
+    Preprocess frame original milik job di process pool
+    Simpan hasilnya (file + baris Image preprocessed) dan catat path di job
+    agar retry tidak mengulang preprocessing
+    
+    Frame duplikat memakai output preprocessed milik frame asalnya (jika sudah ada)
+    
+    Returns: path image preprocessed
+    """
+    original_image = await db.get(Image, job.image_id)
+    if not original_image:
+        raise ValueError(f"Original image {job.image_id} not found")
+    
+    if original_image.duplicate_of_id:
+        existing_path = await db.scalar(
+            select(Image.image_path).where(
+                Image.source_image_id == original_image.duplicate_of_id,
+                Image.image_type == "preprocessed"
+            ).limit(1)
+        )
+        if existing_path:
+            await db.execute(
+                update(InferenceJob).where(InferenceJob.id == job.id).values(
+                    preprocessed_image_path=existing_path
+                )
             )
-        
-        # Resolve alerts jika aman
-        decision_engine.resolve_alerts_if_safe(
-            device_code,
-            parsed_result['total_jentik'],
-            db
+            await db.commit()
+            print(f"♻️  Reusing preprocessed output for duplicate frame {original_image.id}")
+            return existing_path
+    
+    original_data = await storage_service.load(original_image.image_path)
+    prep_width, prep_height, prep_checksum, prep_data = await preprocessing_pool.preprocess(original_data)
+    
+    preprocessed_path = await storage_service.save_content_addressed("preprocessed", prep_data, prep_checksum)
+    
+    db.add(Image(
+        source_image_id=original_image.id,
+        device_id=job.device_id,
+        device_code=job.device_code,
+        image_type="preprocessed",
+        image_path=preprocessed_path,
+        image_blob=prep_data if settings.STORE_IMAGE_BLOBS else None,
+        width=prep_width,
+        height=prep_height,
+        checksum=prep_checksum,
+        captured_at=original_image.captured_at
+    ))
+    await db.execute(
+        update(InferenceJob).where(InferenceJob.id == job.id).values(
+            preprocessed_image_path=preprocessed_path
         )
-        
-        # Update Blynk
-        await blynk_service.update_all(
-            device_code,
-            status,
-            parsed_result['total_jentik']
+    )
+    await db.commit()
+    
+    print(f"  Preprocessed: {os.path.basename(preprocessed_path)}")
+    return preprocessed_path
+
+
+async def record_inference_failure(job: InferenceJob, error: str):
+    """
+    Dead-letter handler - job gagal setelah semua retry
+    Simpan InferenceResult failed agar setiap frame tetap punya hasil
+    """
+    async with AsyncSessionLocal() as db:
+        existing = await db.execute(
+            select(InferenceResult.id).where(InferenceResult.image_id == job.image_id).limit(1)
         )
+        recorded = not existing.first()
+        if recorded:
+            db.add(InferenceResult(
+                image_id=job.image_id,
+                device_id=job.device_id,
+                device_code=job.device_code,
+                status="failed",
+                error_message=error
+            ))
         
-        manipulation_note = " [MANIPULATED]" if is_manipulated else ""
-        print(f"✓ Inference completed for {device_code}: {status} ({parsed_result['total_jentik']} jentik){manipulation_note}")
-        
-    except Exception as e:
-        # Simpan error ke database
-        inference_result = InferenceResult(
-            image_id=original_image_id,
-            device_id=device_id,
-            device_code=device_code,
-            status="failed",
-            error_message=str(e)
+        # Update Blynk dengan status error (lewat outbox)
+        await blynk_outbox.enqueue(db, job.device_code, {blynk_service.STATUS_PIN: "INFERENCE ERROR"})
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Hasil frame ini baru saja disimpan worker lain: jangan timpa dengan status error
+            await db.rollback()
+            print(f"↷ Inference already recorded for image {job.image_id}, not recording failure")
+            return
+    if recorded:
+        # Inference terakhir gagal → action otomatis kembali ke default aman
+        control_state_cache.set_automatic_action(job.device_code, "STOP_SERVO")
+    blynk_outbox.wake()
+    
+    print(f"✗ Inference failed for {job.device_code}: {error}")
+
+
+def parse_captured_at(captured_at: Optional[str]) -> datetime:
+    """Parse captured_at ISO 8601 dari ESP32, fallback ke waktu server"""
+    if captured_at:
+        try:
+            return datetime.fromisoformat(captured_at.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    return get_current_time()
+
+
+async def ingest_frame(
+    current_device: Device,
+    chunks: AsyncIterator[bytes],
+    captured_datetime: datetime,
+    db: AsyncSession
+) -> Tuple[Image, InferenceJob]:
+    """
+    Simpan satu frame original (streaming ke disk) dan tambahkan baris Image + InferenceJob
+    ke session tanpa commit - caller commit dalam satu transaksi
+    
+    Raises UploadTooLargeError jika frame melebihi UPLOAD_MAX_BYTES
+    """
+    # Content-addressed: frame identik menunjuk ke file yang sama
+    original_path, width, height, checksum, size = await storage_service.save_stream_content_addressed(
+        "original",
+        chunks,
+        max_bytes=settings.UPLOAD_MAX_BYTES
+    )
+    duplicate_of_id = await find_duplicate_image(current_device.id, checksum, db)
+    
+    # id di-generate di sini (bukan saat flush) agar batch upload bisa di-insert sekaligus
+    original_image = Image(
+        id=generate_uuid(),
+        device_id=current_device.id,
+        device_code=current_device.device_code,
+        image_type="original",
+        image_path=original_path,
+        image_blob=await storage_service.load(original_path) if settings.STORE_IMAGE_BLOBS else None,
+        width=width,
+        height=height,
+        checksum=checksum,
+        captured_at=captured_datetime,
+        duplicate_of_id=duplicate_of_id
+    )
+    db.add(original_image)
+    
+    # Durable inference job (preprocessing + inference)
+    job = job_queue.enqueue(
+        db,
+        image_id=original_image.id,
+        device_id=current_device.id,
+        device_code=current_device.device_code
+    )
+    
+    duplicate_note = f" [duplicate of {duplicate_of_id}]" if duplicate_of_id else ""
+    print(f"  Original: {os.path.basename(original_path)} ({size} bytes){duplicate_note}")
+    return original_image, job
+
+
+async def queue_inference(job: InferenceJob, db: AsyncSession) -> bool:
+    """
+    Bangunkan worker lokal untuk job yang sudah di-commit
+    Jika queue penuh & policy shed: job ditandai dead dan frame tercatat failed
+    
+    Returns: True jika job akan diproses
+    """
+    if await inference_scheduler.submit(job.id):
+        return True
+    
+    error = "Inference skipped: queue full (load shed)"
+    # Compare-and-set: worker polling (proses ini / lain) bisa saja sudah claim job ini
+    result = await db.execute(
+        update(InferenceJob).where(
+            InferenceJob.id == job.id,
+            InferenceJob.status == "pending"
+        ).values(
+            status="dead",
+            last_error=error,
+            updated_at=get_current_time()
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.commit()
+        print(f"↷ Inference job for {job.device_code} already claimed, not shedding")
+        return True
+    
+    db.add(InferenceResult(
+        image_id=job.image_id,
+        device_id=job.device_id,
+        device_code=job.device_code,
+        status="failed",
+        error_message=error
+    ))
+    await db.commit()
+    # Sama seperti dead-letter scheduler: inference terakhir gagal → default aman
+    control_state_cache.set_automatic_action(job.device_code, "STOP_SERVO")
+    print(f"⚠️  Inference queue full, job shed for {job.device_code}")
+    return False
+
+
+def build_upload_response(device_code: str, queued: bool) -> UploadResponse:
+    """
+    Response cepat - default SLEEP
+    ESP32 akan sleep, nanti action berikutnya disesuaikan berdasarkan hasil inference
+    """
+    return UploadResponse(
+        success=True,
+        message=(
+            "Image uploaded successfully, processing in background"
+            if queued else
+            "Image uploaded successfully, inference skipped (server busy)"
+        ),
+        action="SLEEP",
+        status="PROCESSING",
+        device_code=device_code,
+        total_jentik=0,
+        total_objects=0
+    )
+
+
+async def find_replayed_upload(
+    current_device: Device,
+    idempotency_key: Optional[str],
+    db: AsyncSession
+) -> Optional[UploadResponse]:
+    """Response upload sebelumnya untuk idempotency key ini (None jika key baru)"""
+    if not idempotency_key:
+        return None
+    
+    stored = await idempotency_service.lookup(db, current_device.id, idempotency_key)
+    if stored is None:
+        return None
+    
+    print(f"↷ Replayed upload from {current_device.device_code} (idempotency key {idempotency_key})")
+    return UploadResponse(**stored)
+
+
+async def commit_upload(
+    current_device: Device,
+    original_image: Image,
+    job: InferenceJob,
+    idempotency_key: Optional[str],
+    db: AsyncSession
+) -> UploadResponse:
+    """
+    Commit frame + idempotency key dalam satu transaksi, lalu enqueue inference
+    
+    Jika key sudah dipakai (replay, atau request paralel dengan key sama yang commit duluan)
+    baris Image/job baru dibuang dan response upload sebelumnya dikembalikan
+    """
+    device_code = current_device.device_code
+    record = None
+    
+    if idempotency_key:
+        replayed = await find_replayed_upload(current_device, idempotency_key, db)
+        if replayed:
+            await db.rollback()
+            return replayed
+        record = idempotency_service.record(
+            db,
+            current_device.id,
+            idempotency_key,
+            original_image.id,
+            build_upload_response(device_code, queued=True).model_dump()
         )
-        db.add(inference_result)
-        db.commit()
-        
-        # Update Blynk dengan status error
-        await blynk_service.update_status(device_code, "INFERENCE ERROR")
-        
-        print(f"✗ Inference failed for {device_code}: {str(e)}")
+    
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        replayed = await find_replayed_upload(current_device, idempotency_key, db)
+        if replayed:
+            return replayed
+        raise
+    
+    queued = await queue_inference(job, db)
+    response = build_upload_response(device_code, queued)
+    
+    if record:
+        if not queued:
+            record.response = response.model_dump()
+            await db.commit()
+        idempotency_service.remember(current_device.id, idempotency_key, response.model_dump())
+    
+    return response
 
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_image(
-    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
     captured_at: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload image endpoint - ESP32 POST multipart/form-data
     Flow sesuai rancangan.md:
     1. Auth device (HTTP Basic Auth)
-    2. Save original image
-    3. Preprocess image
-    4. Response cepat ke ESP32
-    5. Inference dijalankan di background
+    2. Save original image (streaming per chunk, SHA-256 bertahap, batas UPLOAD_MAX_BYTES)
+    3. Response cepat ke ESP32 (setelah original tersimpan durable)
+    4. Preprocessing (process pool) + inference dijalankan di background
     
     Expected request:
     - Method: POST
     - Content-Type: multipart/form-data
     - Authorization: Basic base64(device_code:password)
     - Body: image file dengan field name "image"
+    - Idempotency-Key: header opsional; default diturunkan dari (captured_at, checksum).
+      Request ulang dengan key sama mendapat response awal tanpa write/inference ulang
     """
     try:
         # Log request details for debugging
@@ -217,105 +639,236 @@ async def upload_image(
         print(f"Captured at: {captured_at}")
         print(f"=====================\n")
         
-        # Parse captured_at
-        captured_datetime = None
-        if captured_at:
-            try:
-                captured_datetime = datetime.fromisoformat(captured_at.replace('Z', '+00:00'))
-            except:
-                captured_datetime = get_current_time()
-        else:
-            captured_datetime = get_current_time()
+        # Tolak lebih awal jika ukuran sudah diketahui
+        if image.size is not None and image.size > settings.UPLOAD_MAX_BYTES:
+            raise UploadTooLargeError(f"Image exceeds maximum size of {settings.UPLOAD_MAX_BYTES} bytes")
         
-        # Read image data
-        image_data = await image.read()
+        # Key eksplisit: replay dijawab sebelum body disimpan
+        replayed = await find_replayed_upload(current_device, idempotency_key, db)
+        if replayed:
+            return replayed
         
-        # Generate filenames
-        original_filename = generate_image_filename(current_device.device_code, "original")
-        preprocessed_filename = generate_image_filename(current_device.device_code, "preprocessed")
+        captured_datetime = parse_captured_at(captured_at)
         
-        # Paths
-        original_path = os.path.join(settings.IMAGE_ORIGINAL_PATH, original_filename)
-        preprocessed_path = os.path.join(settings.IMAGE_PREPROCESSED_PATH, preprocessed_filename)
+        original_image, job = await ingest_frame(
+            current_device,
+            iter_upload_file(image, settings.UPLOAD_CHUNK_SIZE),
+            captured_datetime,
+            db
+        )
+        response = await commit_upload(
+            current_device,
+            original_image,
+            job,
+            idempotency_key or idempotency_service.derive_key(captured_at, original_image.checksum),
+            db
+        )
         
-        # Save original image
-        width, height, checksum = save_image(image_data, original_path)
+        print(f"✓ Image uploaded successfully from {current_device.device_code}")
+        print(f"  {response.message}\n")
         
-        # Insert original image to database
-        original_image = Image(
-            device_id=current_device.id,
-            device_code=current_device.device_code,
-            image_type="original",
-            image_path=original_path,
-            image_blob=image_data,
-            width=width,
-            height=height,
-            checksum=checksum,
-            captured_at=captured_datetime
-        )
-        db.add(original_image)
-        db.commit()
-        db.refresh(original_image)
+        return response
         
-        # Preprocess image
-        prep_width, prep_height, prep_checksum, prep_data = preprocess_image(
-            original_path,
-            preprocessed_path
-        )
+    except UploadTooLargeError as e:
+        print(f"✗ Upload rejected: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        print(f"✗ Upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+
+@router.post("/upload/raw", response_model=UploadResponse)
+async def upload_image_raw(
+    request: Request,
+    captured_at: Optional[str] = Query(None),
+    x_captured_at: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_device: Device = Depends(get_current_device),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Upload image endpoint (raw body) - ESP32 POST JPEG langsung sebagai body
+    
+    Tanpa multipart: hemat RAM & airtime di ESP32, dan body di-stream
+    langsung ke disk tanpa parsing multipart di server.
+    Pipeline storage/inference sama dengan /upload.
+    
+    Expected request:
+    - Method: POST
+    - Content-Type: image/jpeg
+    - Authorization: Basic base64(device_code:password) atau Bearer token
+    - captured_at: header X-Captured-At atau query ?captured_at= (ISO 8601, opsional)
+    - Idempotency-Key: header opsional (sama seperti /upload)
+    - Body: bytes JPEG
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in ("image/jpeg", "image/jpg"):
+        raise HTTPException(status_code=415, detail="Content-Type must be image/jpeg")
+    
+    captured_at = x_captured_at or captured_at
+    
+    try:
+        print(f"\n=== Raw Upload Request ===")
+        print(f"Device: {current_device.device_code}")
+        print(f"Content-Length: {request.headers.get('content-length')}")
+        print(f"Captured at: {captured_at}")
+        print(f"=========================\n")
         
-        # Insert preprocessed image to database
-        preprocessed_image = Image(
-            device_id=current_device.id,
-            device_code=current_device.device_code,
-            image_type="preprocessed",
-            image_path=preprocessed_path,
-            image_blob=prep_data,
-            width=prep_width,
-            height=prep_height,
-            checksum=prep_checksum,
-            captured_at=captured_datetime
-        )
-        db.add(preprocessed_image)
-        db.commit()
+        replayed = await find_replayed_upload(current_device, idempotency_key, db)
+        if replayed:
+            return replayed
         
-        # Add background task untuk inference
-        background_tasks.add_task(
-            process_inference_background,
-            original_image.id,
-            preprocessed_path,
-            current_device.id,
-            current_device.device_code,
+        original_image, job = await ingest_frame(
+            current_device,
+            request.stream(),
+            parse_captured_at(captured_at),
+            db
+        )
+        response = await commit_upload(
+            current_device,
+            original_image,
+            job,
+            idempotency_key or idempotency_service.derive_key(captured_at, original_image.checksum),
             db
         )
         
-        # Response cepat - default SLEEP
-        # ESP32 akan sleep, nanti action berikutnya disesuaikan berdasarkan hasil inference
-        print(f"✓ Image uploaded successfully from {current_device.device_code}")
-        print(f"  Original: {original_filename}")
-        print(f"  Preprocessed: {preprocessed_filename}")
-        print(f"  Background inference queued\n")
+        print(f"✓ Image uploaded successfully from {current_device.device_code} (raw)")
+        print(f"  {response.message}\n")
         
-        return UploadResponse(
-            success=True,
-            message="Image uploaded successfully, processing in background",
-            action="SLEEP",
-            status="PROCESSING",
-            device_code=current_device.device_code,
-            total_jentik=0,
-            total_objects=0
-        )
+        return response
         
+    except UploadTooLargeError as e:
+        print(f"✗ Upload rejected: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(f"✗ Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_image_batch(
+    images: List[UploadFile] = File(...),
+    captured_at: List[str] = Form([]),
+    current_device: Device = Depends(get_current_device),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Batch upload endpoint - ESP32 mengirim frame yang di-buffer (SD card) saat offline
+    
+    Satu request = satu auth, satu parsing multipart, satu transaksi:
+    semua baris Image + InferenceJob di-commit sekaligus, lalu inference di-enqueue per frame.
+    Batch bersifat all-or-nothing: jika satu frame gagal, tidak ada frame yang tersimpan
+    sehingga ESP32 cukup mengirim ulang batch yang sama.
+    
+    Expected request:
+    - Method: POST
+    - Content-Type: multipart/form-data
+    - Authorization: Basic base64(device_code:password) atau Bearer token
+    - Body: field "images" berulang (satu per frame, maksimal UPLOAD_BATCH_MAX_FRAMES)
+      dan field "captured_at" berulang dengan urutan yang sama (opsional, boleh kosong per frame)
+    """
+    if len(images) > settings.UPLOAD_BATCH_MAX_FRAMES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds maximum of {settings.UPLOAD_BATCH_MAX_FRAMES} frames"
+        )
+    if captured_at and len(captured_at) != len(images):
+        raise HTTPException(
+            status_code=422,
+            detail="captured_at must be omitted or have one value per image"
+        )
+    
+    print(f"\n=== Batch Upload Request ===")
+    print(f"Device: {current_device.device_code}")
+    print(f"Frames: {len(images)}")
+    print(f"===========================\n")
+    
+    ingested: List[Tuple[Image, InferenceJob]] = []
+    try:
+        for index, image in enumerate(images):
+            if image.size is not None and image.size > settings.UPLOAD_MAX_BYTES:
+                raise UploadTooLargeError(
+                    f"Frame {index} exceeds maximum size of {settings.UPLOAD_MAX_BYTES} bytes"
+                )
+            
+            ingested.append(await ingest_frame(
+                current_device,
+                iter_upload_file(image, settings.UPLOAD_CHUNK_SIZE),
+                parse_captured_at(captured_at[index] if captured_at else None),
+                db
+            ))
+        
+        # Satu transaksi untuk semua frame
+        await db.commit()
+        
+    except Exception as e:
+        # File content-addressed tidak dihapus: bisa dipakai frame lain
+        # dan dipakai ulang saat ESP32 mengirim ulang batch yang sama
+        await db.rollback()
+        
+        print(f"✗ Batch upload failed: {str(e)}")
+        if isinstance(e, UploadTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    frames = []
+    for index, (original_image, job) in enumerate(ingested):
+        frames.append(BatchFrameResult(
+            index=index,
+            image_id=original_image.id,
+            job_id=job.id,
+            captured_at=original_image.captured_at,
+            queued=await queue_inference(job, db)
+        ))
+    
+    queued_count = sum(1 for frame in frames if frame.queued)
+    print(f"✓ Batch of {len(frames)} frames uploaded from {current_device.device_code}")
+    print(f"  Background inference queued for {queued_count} frames\n")
+    
+    return BatchUploadResponse(
+        success=True,
+        message=f"{len(frames)} images uploaded successfully, {queued_count} processing in background",
+        action="SLEEP",
+        status="PROCESSING",
+        device_code=current_device.device_code,
+        total_frames=len(frames),
+        frames=frames
+    )
+
+
+@router.post("/device/token", response_model=DeviceTokenResponse)
+async def issue_device_token(
+    current_device: Device = Depends(get_basic_authenticated_device)
+):
+    """
+    Issue session token - login sekali dengan HTTP Basic Auth
+    
+    Token dipakai di request berikutnya sebagai:
+        Authorization: Bearer <access_token>
+    
+    Verifikasi token hanya HMAC (tanpa query DB / bcrypt).
+    Minta token baru sebelum expires_at.
+    """
+    token, expires_at = create_device_token(current_device)
+    
+    return DeviceTokenResponse(
+        access_token=token,
+        expires_in=settings.DEVICE_TOKEN_TTL_SECONDS,
+        expires_at=to_wib(datetime.fromtimestamp(expires_at, tz=timezone.utc))
+    )
+
+
 @router.get("/device/info", response_model=DeviceResponse)
 async def get_device_info(
-    current_device: Device = Depends(get_current_device)
+    current_device: Device = Depends(get_current_device),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get device information"""
-    return current_device
+    # Device dari session token hanya berisi id & device_code, ambil data lengkap
+    device = await db.get(Device, current_device.id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device
 
 
 @router.get("/health")
@@ -327,13 +880,34 @@ async def health_check():
     }
 
 
+@router.get("/metrics")
+async def metrics(api_key: str = Depends(verify_docs_api_key)):
+    """
+    Metrics pipeline inference (butuh ?key= seperti /docs)
+    Termasuk state circuit breaker & limit concurrency Roboflow
+    """
+    return {
+        "timestamp": get_current_time().isoformat(),
+        "scheduler": inference_scheduler.stats(),
+        "roboflow": {**roboflow_service.guard.stats(), "hedging": roboflow_service.hedger.stats()},
+        "inference_cache": inference_cache.stats(),
+        "inference_backend": roboflow_service.backend.stats(),
+        "idempotency": idempotency_service.stats(),
+        "blynk_outbox": blynk_outbox.stats(),
+        "notifications": notification_aggregator.stats(),
+        "decisions": decision_metrics.stats(),
+        "event_bus": event_bus.stats(),
+        "control_state_cache": control_state_cache.stats(),
+    }
+
+
 # ==================== DEVICE CONTROL ENDPOINTS (ENDPOINT-BASED COMMANDS) ====================
 
 @router.get("/device/{device_code}/control")
 async def get_device_control(
     device_code: str,
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     IoT Polling Endpoint - Get control command
@@ -354,27 +928,42 @@ async def get_device_control(
     if current_device.device_code != device_code:
         raise HTTPException(status_code=403, detail="Access denied")
     
+    # Action otomatis dari cache (write-through); miss → load dari DB
+    automatic_action = control_state_cache.get(device_code)
+    if automatic_action is None:
+        automatic_action = await load_automatic_action(device_code, db)
+    
+    # Manual control overrides automatic if status=PENDING
+    # (selalu dari DB: command bisa diubah proses API lain)
+    return await DeviceControlService.get_control_response(db, device_code, automatic_action)
+
+
+def to_servo_action(action: str) -> str:
+    """Map action decision engine ke command servo"""
+    return "ACTIVATE_SERVO" if action == "ACTIVATE" else "STOP_SERVO"
+
+
+async def load_automatic_action(device_code: str, db: AsyncSession) -> str:
+    """
+    Load action otomatis device (dari inference terakhir) dari DB dan isi control_state_cache
+    """
+    version = control_state_cache.version(device_code)
+    
     # Get latest inference result to determine automatic action
-    latest_inference = db.query(InferenceResult).filter(
-        InferenceResult.device_code == device_code
-    ).order_by(InferenceResult.inference_at.desc()).first()
+    result = await db.execute(
+        select(InferenceResult.status, InferenceResult.total_jentik).where(
+            InferenceResult.device_code == device_code
+        ).order_by(InferenceResult.inference_at.desc()).limit(1)
+    )
+    latest_inference = result.first()
     
     # Default safe state
     automatic_action = "STOP_SERVO"
     if latest_inference and latest_inference.status == "success":
         status = decision_engine.determine_status(latest_inference.total_jentik)
-        action = decision_engine.determine_action(status)
-        # Map to servo commands
-        automatic_action = "ACTIVATE_SERVO" if action == "ACTIVATE" else "STOP_SERVO"
-    
-    # Get control response (manual overrides if status=PENDING)
-    response = DeviceControlService.get_control_response(
-        db=db,
-        device_code=device_code,
-        automatic_action=automatic_action
-    )
+        automatic_action = to_servo_action(decision_engine.determine_action(status))
     
-    return response
+    return control_state_cache.fill(device_code, version, automatic_action)
 
 
 @router.post("/device/{device_code}/activate_servo")
@@ -382,7 +971,7 @@ async def activate_servo(
     device_code: str,
     message: Optional[str] = Form(None),
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Activate Servo - Endpoint IS the command
@@ -406,7 +995,7 @@ async def activate_servo(
     
     try:
         # Set control - endpoint name IS the command
-        control = DeviceControlService.set_control(
+        control = await DeviceControlService.set_control(
             db=db,
             device_code=device_code,
             control_command="ACTIVATE_SERVO",
@@ -431,7 +1020,7 @@ async def stop_servo(
     device_code: str,
     message: Optional[str] = Form(None),
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Stop Servo - Endpoint IS the command
@@ -455,7 +1044,7 @@ async def stop_servo(
     
     try:
         # Set control - endpoint name IS the command
-        control = DeviceControlService.set_control(
+        control = await DeviceControlService.set_control(
             db=db,
             device_code=device_code,
             control_command="STOP_SERVO",
@@ -480,7 +1069,7 @@ async def control_executed(
     device_code: str,
     message: Optional[str] = Form(None),
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Mark Control as Executed - Endpoint IS the status
@@ -504,7 +1093,7 @@ async def control_executed(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Update status - endpoint name IS the status
-    control = DeviceControlService.update_status(
+    control = await DeviceControlService.update_status(
         db=db,
         device_code=device_code,
         status="EXECUTED",
@@ -518,7 +1107,7 @@ async def control_executed(
         )
     
     # After marking as executed, automatically set STOP_SERVO command
-    DeviceControlService.set_control(
+    await DeviceControlService.set_control(
         db=db,
         device_code=device_code,
         control_command="STOP_SERVO",
@@ -540,7 +1129,7 @@ async def control_failed(
     device_code: str,
     message: Optional[str] = Form(None),
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Mark Control as Failed - Endpoint IS the status
@@ -563,7 +1152,7 @@ async def control_failed(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Update status - endpoint name IS the status
-    control = DeviceControlService.update_status(
+    control = await DeviceControlService.update_status(
         db=db,
         device_code=device_code,
         status="FAILED",
@@ -590,7 +1179,7 @@ async def control_failed(
 async def get_control_status(
     device_code: str,
     current_device: Device = Depends(get_current_device),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get Current Control Status
@@ -611,7 +1200,7 @@ async def get_control_status(
     if current_device.device_code != device_code:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    control = DeviceControlService.get_control(db, device_code)
+    control = await DeviceControlService.get_control(db, device_code)
     
     if not control:
         return {
@@ -1,16 +1,44 @@
+import base64
+import hashlib
+import hmac
+import json
 import secrets
+import time
+from typing import Any, Dict, Optional, Tuple
 from passlib.context import CryptContext
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Depends, Query
-from fastapi.security import HTTPBasic, HTTPBasicCredentials, APIKeyQuery
+from fastapi.security import (
+    HTTPBasic,
+    HTTPBasicCredentials,
+    HTTPBearer,
+    HTTPAuthorizationCredentials,
+    APIKeyQuery
+)
 from app.models.device import DeviceAuth, Device
 from app.database import get_db
 from app.config import settings
+from app.utils.cache import TTLCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBasic()
+optional_basic = HTTPBasic(auto_error=False)
+optional_bearer = HTTPBearer(auto_error=False)
 docs_api_key = APIKeyQuery(name="key", auto_error=False)
 
+# Cache credential yang sudah lolos bcrypt:
+# (device_code, credential_digest) -> snapshot kolom Device
+credential_cache = TTLCache(
+    max_size=settings.AUTH_CACHE_MAX_SIZE,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS
+)
+
+# Token yang diterbitkan sebelum waktu ini (unix detik, per device_code) dianggap tidak valid.
+# Per proses: hanya diisi oleh perubahan Device/DeviceAuth lewat ORM di proses ini
+_token_revoked_before: Dict[str, int] = {}
+_TOKEN_KEY = hashlib.sha256(f"device-token:{settings.SECRET_KEY}".encode("utf-8")).digest()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify plain password against hashed password"""
@@ -22,23 +50,137 @@ def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def credential_digest(device_code: str, password: str) -> str:
+    """
+    Digest credential untuk key cache
+    HMAC dengan SECRET_KEY supaya password plain tidak disimpan di memory
+    """
+    message = f"{device_code}:{password}".encode("utf-8")
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def snapshot_device(device: Device) -> Dict[str, Any]:
+    """Ambil nilai kolom Device (tanpa relationship) untuk disimpan di cache"""
+    return {
+        column.key: getattr(device, column.key)
+        for column in Device.__table__.columns
+    }
+
+
+def invalidate_device_credentials(device_code: str) -> int:
+    """
+    Hapus semua credential cache milik device
+    Dipanggil saat device dinonaktifkan atau password diganti
+    """
+    return credential_cache.invalidate_where(lambda key, _: key[0] == device_code)
+
+
+@event.listens_for(Device, "after_update")
+@event.listens_for(Device, "after_delete")
+@event.listens_for(DeviceAuth, "after_update")
+@event.listens_for(DeviceAuth, "after_delete")
+def _invalidate_on_device_change(mapper, connection, target):
+    """Invalidasi cache otomatis saat Device/DeviceAuth diubah lewat ORM di proses ini"""
+    invalidate_device_credentials(target.device_code)
+    # Detik bulat seperti iat: token yang diterbitkan di detik yang sama setelah
+    # perubahan tetap valid (perbandingan iat < revoked_before)
+    _token_revoked_before[target.device_code] = int(time.time())
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def create_device_token(device: Device) -> Tuple[str, int]:
+    """
+    Buat session token device yang ditandatangani HMAC-SHA256
+    Format: base64url(payload_json).base64url(signature)
+    Returns: (token, expires_at unix timestamp)
+    """
+    issued_at = int(time.time())
+    expires_at = issued_at + settings.DEVICE_TOKEN_TTL_SECONDS
+    payload = {
+        "sub": device.id,
+        "code": device.device_code,
+        "iat": issued_at,
+        "exp": expires_at
+    }
+    body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    signature = hmac.new(_TOKEN_KEY, body.encode("ascii"), hashlib.sha256).digest()
+    return f"{body}.{_b64encode(signature)}", expires_at
+
+
+def verify_device_token(token: str) -> Dict[str, Any]:
+    """
+    Verifikasi session token tanpa query DB maupun bcrypt
+    Returns payload jika valid
+    Raises HTTPException 401 jika signature salah, expired, atau sudah direvoke
+    
+    Batasan: revoke (password diganti / device dinonaktifkan / dihapus) hanya berlaku
+    di proses yang melakukan perubahan. Di worker/pod lain token lama tetap valid
+    sampai exp, maksimal DEVICE_TOKEN_TTL_SECONDS.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired device token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    try:
+        body, signature = token.split(".", 1)
+        expected = hmac.new(_TOKEN_KEY, body.encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            raise invalid
+        payload = json.loads(_b64decode(body))
+    except HTTPException:
+        raise
+    except Exception:
+        raise invalid
+    
+    if payload.get("exp", 0) <= time.time():
+        raise invalid
+    
+    if payload.get("iat", 0) < _token_revoked_before.get(payload.get("code"), 0):
+        raise invalid
+    
+    return payload
+
+
 def authenticate_device(device_code: str, password: str, db: Session) -> Device:
     """
     Authenticate device using device_code and password
     Returns Device object if authentication successful
     Raises HTTPException if authentication failed
+    
+    Credential yang sudah terverifikasi disimpan di credential_cache,
+    sehingga request berikutnya tidak perlu query DB maupun bcrypt.
+    Device yang dikembalikan dari cache adalah object transient (tidak terikat session).
     """
-    device_auth = db.query(DeviceAuth).filter(
+    cache_key = (device_code, credential_digest(device_code, password))
+    cached = credential_cache.get(cache_key)
+    if cached is not None:
+        return Device(**cached)
+    
+    # Satu query join untuk DeviceAuth + Device
+    row = db.query(DeviceAuth, Device).outerjoin(
+        Device, Device.id == DeviceAuth.device_id
+    ).filter(
         DeviceAuth.device_code == device_code
     ).first()
     
-    if not device_auth:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid device credentials",
             headers={"WWW-Authenticate": "Basic"},
         )
     
+    device_auth, device = row
+    
     if not verify_password(password, device_auth.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,8 +188,6 @@ def authenticate_device(device_code: str, password: str, db: Session) -> Device:
             headers={"WWW-Authenticate": "Basic"},
         )
     
-    device = db.query(Device).filter(Device.id == device_auth.device_id).first()
-    
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -60,20 +200,49 @@ def authenticate_device(device_code: str, password: str, db: Session) -> Device:
             detail="Device is not active"
         )
     
+    credential_cache.set(cache_key, snapshot_device(device))
     return device
 
 
-def get_current_device(
+def get_basic_authenticated_device(
     credentials: HTTPBasicCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> Device:
     """
-    Dependency untuk mendapatkan device yang terautentikasi
-    Menggunakan HTTP Basic Auth
+    Dependency autentikasi khusus HTTP Basic Auth
+    Dipakai endpoint penerbitan token
     """
     return authenticate_device(credentials.username, credentials.password, db)
 
 
+def get_current_device(
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    credentials: Optional[HTTPBasicCredentials] = Depends(optional_basic),
+    db: Session = Depends(get_db)
+) -> Device:
+    """
+    Dependency untuk mendapatkan device yang terautentikasi
+    Menerima Bearer session token (dari /device/token) atau HTTP Basic Auth
+    
+    Device dari token adalah object transient berisi id dan device_code saja
+    (is_active=True tanpa cek DB). Device yang dinonaktifkan ditolak dengan 401
+    (token direvoke) di proses yang menonaktifkan, bukan 403 seperti Basic Auth;
+    di proses lain token tetap diterima sampai expired (maks DEVICE_TOKEN_TTL_SECONDS).
+    """
+    if bearer:
+        payload = verify_device_token(bearer.credentials)
+        return Device(id=payload["sub"], device_code=payload["code"], is_active=True)
+    
+    if credentials:
+        return authenticate_device(credentials.username, credentials.password, db)
+    
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+
 def verify_docs_api_key(api_key: str = Depends(docs_api_key)):
     """
     Dependency untuk autentikasi akses dokumentasi API
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -15,6 +16,48 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def get_async_database_url(database_url: str) -> str:
+    """
+    Turunkan URL async dari DATABASE_URL sync
+    mysql+pymysql -> mysql+aiomysql, sqlite -> sqlite+aiosqlite
+    """
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+
+    scheme, sep, rest = database_url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect == "mysql":
+        return f"mysql+aiomysql{sep}{rest}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return database_url
+
+
+ASYNC_DATABASE_URL = get_async_database_url(settings.DATABASE_URL)
+
+# Pool size hanya berlaku untuk server database (bukan sqlite lokal)
+_async_pool_options = {} if ASYNC_DATABASE_URL.startswith("sqlite") else {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    echo=False,
+    **_async_pool_options
+)
+
+# expire_on_commit=False: atribut tetap bisa dibaca setelah commit tanpa lazy load
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
 def get_db():
     """Dependency untuk mendapatkan database session"""
     db = SessionLocal()
@@ -24,6 +67,12 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency untuk mendapatkan async database session (tidak memblokir event loop)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialize database tables"""
     import app.models.device
@@ -31,4 +80,7 @@ def init_db():
     import app.models.inference
     import app.models.alert
     import app.models.manual_control
+    import app.models.inference_job
+    import app.models.idempotency_key
+    import app.models.blynk_outbox
     Base.metadata.create_all(bind=engine)
@@ -3,5 +3,8 @@ from app.models.image import Image
 from app.models.inference import InferenceResult
 from app.models.alert import Alert
 from app.models.manual_control import DeviceControl
+from app.models.inference_job import InferenceJob
+from app.models.idempotency_key import IdempotencyKey
+from app.models.blynk_outbox import BlynkOutbox
 
-__all__ = ["Device", "DeviceAuth", "Image", "InferenceResult", "Alert", "DeviceControl"]
+__all__ = ["Device", "DeviceAuth", "Image", "InferenceResult", "Alert", "DeviceControl", "InferenceJob", "IdempotencyKey", "BlynkOutbox"]
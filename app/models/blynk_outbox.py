@@ -0,0 +1,49 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.dialects.mysql import CHAR
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+from app.config import get_current_time
+
+
+def generate_uuid():
+    return str(uuid.uuid4())
+
+
+class BlynkOutbox(Base):
+    """
+    Outbox durable untuk write virtual pin Blynk
+
+    Satu baris per pin dashboard: write baru dari device mana pun menimpa value
+    (coalescing), jadi hanya nilai terakhir yang dikirim. Ditulis dalam transaksi yang
+    sama dengan InferenceResult, lalu dikirim oleh flusher background
+    (lihat blynk_outbox service). device_code = device yang terakhir menulis.
+
+    Status:
+    - pending: value belum terkirim (available_at <= now → siap dikirim)
+    - sent: value terakhir sudah terkirim (sent_value = value)
+
+    sent_value = value yang sedang tampil di dashboard (terakhir terkirim)
+    """
+    __tablename__ = "blynk_outbox"
+    __table_args__ = (
+        UniqueConstraint("pin", name="uq_blynk_outbox_pin"),
+        Index("idx_blynk_outbox_pending", "status", "available_at"),
+    )
+
+    id: Mapped[str] = mapped_column(CHAR(36), primary_key=True, default=generate_uuid)
+    device_code: Mapped[str] = mapped_column(String(255), nullable=False)
+    pin: Mapped[str] = mapped_column(String(10), nullable=False)
+    value: Mapped[str] = mapped_column(String(255), nullable=False)
+    sent_value: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)  # pending | sent
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    available_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time, onupdate=get_current_time)
+
+    def __repr__(self):
+        return f"<BlynkOutbox(device_code={self.device_code}, pin={self.pin}, value={self.value}, status={self.status})>"
@@ -0,0 +1,37 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+from sqlalchemy import String, DateTime, ForeignKey, JSON, Index, UniqueConstraint
+from sqlalchemy.dialects.mysql import CHAR
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+from app.config import get_current_time
+
+
+def generate_uuid():
+    return str(uuid.uuid4())
+
+
+class IdempotencyKey(Base):
+    """
+    Idempotency key upload device
+
+    Satu baris per upload yang berhasil, ditulis dalam transaksi yang sama dengan baris Image.
+    Request ulang dengan key yang sama (ESP32 retry karena response hilang) mendapat
+    response yang tersimpan tanpa menulis Image / job baru.
+
+    Key dari header Idempotency-Key, atau diturunkan dari (captured_at, checksum)
+    Baris lebih tua dari IDEMPOTENCY_RETENTION_SECONDS dihapus berkala (lihat idempotency_service)
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("device_id", "idempotency_key", name="uq_idempotency_device_key"),
+        Index("idx_idempotency_created_at", "created_at"),
+    )
+
+    id: Mapped[str] = mapped_column(CHAR(36), primary_key=True, default=generate_uuid)
+    device_id: Mapped[str] = mapped_column(CHAR(36), ForeignKey("devices.id"), nullable=False)
+    idempotency_key: Mapped[str] = mapped_column(String(255), nullable=False)
+    image_id: Mapped[Optional[str]] = mapped_column(CHAR(36), ForeignKey("images.id"), nullable=True)
+    response: Mapped[Dict[str, Any]] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time)
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, LargeBinary
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, LargeBinary, Index
 from sqlalchemy.dialects.mysql import CHAR, LONGBLOB
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from app.database import Base
@@ -14,18 +14,34 @@ def generate_uuid():
 
 class Image(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        # Lookup frame identik per device (dedup content-addressed)
+        Index("idx_images_checksum", "checksum", "device_id"),
+    )
     
     id: Mapped[str] = mapped_column(CHAR(36), primary_key=True, default=generate_uuid)
     device_id: Mapped[str] = mapped_column(CHAR(36), ForeignKey("devices.id"), nullable=False)
     device_code: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     image_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # original | preprocessed
     image_path: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
-    image_blob: Mapped[Optional[bytes]] = mapped_column(LONGBLOB, nullable=True)
+    # LONGBLOB di MySQL, BLOB biasa di sqlite (local run)
+    # deferred: tidak ikut di-load oleh query Image biasa (hanya saat atribut diakses)
+    image_blob: Mapped[Optional[bytes]] = mapped_column(
+        LargeBinary().with_variant(LONGBLOB(), "mysql"),
+        nullable=True,
+        deferred=True
+    )
     width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     checksum: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     captured_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     uploaded_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time)
+    # preprocessed: id image original asalnya
+    source_image_id: Mapped[Optional[str]] = mapped_column(CHAR(36), ForeignKey("images.id"), nullable=True)
+    # original: id frame pertama dengan checksum sama dari device yang sama (file & hasil dipakai ulang)
+    duplicate_of_id: Mapped[Optional[str]] = mapped_column(CHAR(36), ForeignKey("images.id"), nullable=True)
+    # dHash 64 bit (hex) frame original, untuk scene-change gate sebelum inference
+    perceptual_hash: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
     
     # Relationships
     device = relationship("Device", back_populates="images")
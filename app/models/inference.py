@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from typing import Optional, Any, Dict
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Text, JSON, UniqueConstraint
 from sqlalchemy.dialects.mysql import CHAR
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from app.database import Base
@@ -14,6 +14,10 @@ def generate_uuid():
 
 class InferenceResult(Base):
     __tablename__ = "inference_results"
+    __table_args__ = (
+        # Satu hasil per frame: job yang di-claim ulang tidak bisa menyimpan hasil kedua
+        UniqueConstraint("image_id", name="uq_inference_results_image_id"),
+    )
     
     id: Mapped[str] = mapped_column(CHAR(36), primary_key=True, default=generate_uuid)
     image_id: Mapped[str] = mapped_column(CHAR(36), ForeignKey("images.id"), nullable=False)
@@ -28,6 +32,10 @@ class InferenceResult(Base):
     parsing_version: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     status: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # success | failed
     error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Hasil di-copy dari inference lain (tanpa preprocessing/Roboflow ulang)
+    reused_from_id: Mapped[Optional[str]] = mapped_column(CHAR(36), ForeignKey("inference_results.id"), nullable=True)
+    # duplicate (checksum sama) | unchanged_scene (perceptual hash mirip)
+    reuse_reason: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     
     # Relationships
     device = relationship("Device", back_populates="inference_results")
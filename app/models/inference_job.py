@@ -0,0 +1,56 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Index
+from sqlalchemy.dialects.mysql import CHAR
+from sqlalchemy.orm import relationship, Mapped, mapped_column
+from app.database import Base
+from app.config import get_current_time
+
+
+def generate_uuid():
+    return str(uuid.uuid4())
+
+
+class InferenceJob(Base):
+    """
+    Durable inference job - satu baris per frame original yang perlu di-inference
+
+    Ditulis oleh upload_image dalam transaksi yang sama dengan baris Image,
+    lalu di-claim oleh worker (proses mana pun) dengan SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Status:
+    - pending: menunggu di-claim (available_at <= now)
+    - running: sedang dikerjakan, lease berlaku sampai lease_expires_at (diperpanjang
+      worker selama handler berjalan)
+    - done: selesai (InferenceResult sudah tersimpan)
+    - dead: gagal setelah max_attempts (dead-letter), InferenceResult failed tersimpan
+    """
+    __tablename__ = "inference_jobs"
+    __table_args__ = (
+        Index("idx_inference_jobs_claim", "status", "available_at"),
+    )
+
+    id: Mapped[str] = mapped_column(CHAR(36), primary_key=True, default=generate_uuid)
+    image_id: Mapped[str] = mapped_column(CHAR(36), ForeignKey("images.id"), nullable=False, index=True)
+    device_id: Mapped[str] = mapped_column(CHAR(36), ForeignKey("devices.id"), nullable=False)
+    device_code: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
+    preprocessed_image_path: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)  # pending | running | done | dead
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=5, nullable=False)
+    available_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time, nullable=False)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    locked_by: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=get_current_time, onupdate=get_current_time)
+
+    # Relationships
+    image = relationship("Image")
+
+    def __repr__(self):
+        return (
+            f"<InferenceJob(device_code={self.device_code}, "
+            f"status={self.status}, attempts={self.attempts})>"
+        )
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class UploadRequest(BaseModel):
@@ -22,6 +22,26 @@ class UploadResponse(BaseModel):
         from_attributes = True
 
 
+class BatchFrameResult(BaseModel):
+    """Hasil per frame pada batch upload (urutan sama dengan request)"""
+    index: int
+    image_id: str
+    job_id: str
+    captured_at: datetime
+    queued: bool
+
+
+class BatchUploadResponse(BaseModel):
+    """Response schema untuk batch upload endpoint"""
+    success: bool
+    message: str
+    action: str  # ACTIVATE | SLEEP
+    status: str
+    device_code: str
+    total_frames: int
+    frames: List[BatchFrameResult]
+
+
 class DeviceResponse(BaseModel):
     """Response schema untuk device info"""
     id: str
@@ -33,3 +53,11 @@ class DeviceResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+
+class DeviceTokenResponse(BaseModel):
+    """Response schema untuk penerbitan session token device"""
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+    expires_at: datetime
@@ -0,0 +1,250 @@
+"""
+Blynk Outbox - write virtual pin Blynk lewat tabel blynk_outbox + flusher background
+
+Design Philosophy:
+- Pipeline inference hanya menulis baris outbox dalam transaksi yang sama dengan
+  InferenceResult → latency inference tidak bergantung pada ketersediaan Blynk,
+  dan write tidak hilang saat Blynk down / proses restart
+- Pin V0/V1 adalah satu dashboard bersama (satu BLYNK_AUTH_TOKEN) untuk semua device,
+  jadi coalescing per pin: satu baris per pin, write baru (device mana pun) menimpa
+  value lama dan hanya nilai terakhir yang dikirim. Value device lain yang sedang
+  menunggu retry ikut tertimpa, tidak pernah dikirim setelah value yang lebih baru
+- sent_value = value yang sedang tampil di dashboard; write dengan value yang sama
+  tidak dikirim ulang
+- Flusher mengirim pin pending dalam batch (/batch/update multi-pin),
+  retry dengan exponential backoff jika gagal
+- Status sent / jadwal retry di-update dengan compare-and-set pada value: write baru
+  yang masuk selama pengiriman tetap pending dan dikirim di flush berikutnya
+"""
+
+import asyncio
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings, get_current_time
+from app.database import AsyncSessionLocal
+from app.models.blynk_outbox import BlynkOutbox
+from app.services.blynk_service import blynk_service
+
+
+# (id, pin, value, sent_value, attempts)
+OutboxItem = Tuple[str, str, str, Optional[str], int]
+
+
+class BlynkOutboxService:
+    """Enqueue write pin Blynk + flusher background"""
+
+    def __init__(self):
+        self.flush_interval = settings.BLYNK_OUTBOX_FLUSH_INTERVAL_SECONDS
+        self.batch_size = settings.BLYNK_OUTBOX_BATCH_SIZE
+        self.retry_base_seconds = settings.BLYNK_OUTBOX_RETRY_BASE_SECONDS
+        self.retry_max_seconds = settings.BLYNK_OUTBOX_RETRY_MAX_SECONDS
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+        # Counters untuk monitoring
+        self.enqueued = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.requests = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(blynk_service.auth_token)
+
+    async def enqueue(self, db: AsyncSession, device_code: str, pins: Dict[str, Any]):
+        """
+        Tulis value pin ke outbox (tanpa commit)
+        Caller commit bersama hasil inference, lalu panggil wake()
+        """
+        if not self.enabled:
+            return
+
+        now = get_current_time()
+        for pin, value in pins.items():
+            value = str(value)
+            row = await self._get_row(db, pin)
+
+            if row is None:
+                try:
+                    # Savepoint: insert paralel untuk pin yang sama tidak menggagalkan transaksi caller
+                    async with db.begin_nested():
+                        db.add(BlynkOutbox(
+                            device_code=device_code,
+                            pin=pin,
+                            value=value,
+                            status="pending",
+                            attempts=0,
+                            available_at=now
+                        ))
+                    self.enqueued += 1
+                    continue
+                except IntegrityError:
+                    row = await self._get_row(db, pin)
+
+            if row.status == "pending" and row.value == value:
+                # Sudah menunggu dikirim (termasuk jadwal retry-nya)
+                self.coalesced += 1
+                continue
+
+            row.device_code = device_code
+            row.value = value
+            row.status = "pending"
+            row.attempts = 0
+            row.available_at = now
+            row.last_error = None
+            self.enqueued += 1
+
+    async def _get_row(self, db: AsyncSession, pin: str) -> Optional[BlynkOutbox]:
+        return await db.scalar(select(BlynkOutbox).where(BlynkOutbox.pin == pin))
+
+    def wake(self):
+        """Minta flusher mengirim sekarang (setelah commit), tanpa menunggu poll interval"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """Start flusher background (dipanggil di startup event)"""
+        if self._task or not self.enabled:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="blynk-outbox-flusher")
+        print(f"✓ Blynk outbox flusher started (every {self.flush_interval}s, batch {self.batch_size})")
+
+    async def stop(self):
+        """Stop flusher; value pending tetap di tabel dan dikirim setelah start berikutnya"""
+        if not self._task:
+            return
+        self._stopping = True
+        self.wake()
+        try:
+            await asyncio.wait_for(self._task, timeout=settings.BLYNK_HTTP_TIMEOUT + 1)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        print("✓ Blynk outbox flusher stopped")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                flushed = await self.flush_once()
+            except Exception as e:
+                flushed = 0
+                print(f"✗ Blynk outbox flush error: {str(e)}")
+
+            if flushed >= self.batch_size:
+                # Masih ada backlog, langsung lanjut
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def flush_once(self) -> int:
+        """
+        Kirim satu batch value pending
+        Returns: jumlah baris outbox yang diproses
+        """
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(
+                    BlynkOutbox.id, BlynkOutbox.pin, BlynkOutbox.value,
+                    BlynkOutbox.sent_value, BlynkOutbox.attempts
+                ).where(
+                    BlynkOutbox.status == "pending",
+                    BlynkOutbox.available_at <= get_current_time()
+                ).order_by(BlynkOutbox.updated_at).limit(self.batch_size)
+            )).all()
+            # Akhiri transaksi baca agar koneksi DB tidak tertahan selama request Blynk
+            await db.commit()
+            if not rows:
+                return 0
+
+            items: List[OutboxItem] = [tuple(row) for row in rows]
+            unchanged = [item for item in items if item[3] == item[2]]
+            for item in unchanged:
+                # Dashboard sudah menampilkan value ini
+                await self._mark_sent(db, item)
+            self.skipped += len(unchanged)
+
+            to_send = [item for item in items if item[3] != item[2]]
+            if to_send:
+                self.requests += 1
+                ok = await blynk_service.update_pins({item[1]: item[2] for item in to_send})
+                for item in to_send:
+                    if ok:
+                        await self._mark_sent(db, item)
+                    else:
+                        await self._mark_failed(db, item, "Blynk batch update failed")
+                if ok:
+                    self.sent += len(to_send)
+                else:
+                    self.failed += len(to_send)
+            await db.commit()
+
+            return len(items)
+
+    async def _mark_sent(self, db: AsyncSession, item: OutboxItem):
+        row_id, _, value, _, _ = item
+        # Compare-and-set: value baru yang masuk selama pengiriman tetap pending
+        # (sent_value tetap value yang benar-benar dikirim)
+        await db.execute(
+            update(BlynkOutbox).where(BlynkOutbox.id == row_id).values(
+                sent_value=value,
+                sent_at=get_current_time(),
+                updated_at=BlynkOutbox.updated_at
+            ).execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            update(BlynkOutbox).where(
+                BlynkOutbox.id == row_id,
+                BlynkOutbox.value == value
+            ).values(
+                status="sent",
+                attempts=0,
+                last_error=None,
+                updated_at=BlynkOutbox.updated_at
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def _mark_failed(self, db: AsyncSession, item: OutboxItem, error: str):
+        row_id, _, value, _, attempts = item
+        delay = min(self.retry_base_seconds * (2 ** attempts), self.retry_max_seconds)
+        await db.execute(
+            update(BlynkOutbox).where(
+                BlynkOutbox.id == row_id,
+                BlynkOutbox.value == value
+            ).values(
+                attempts=attempts + 1,
+                available_at=get_current_time() + timedelta(seconds=delay),
+                last_error=error,
+                # updated_at = waktu value ditulis: retry tidak mengubah urutan flush
+                updated_at=BlynkOutbox.updated_at
+            ).execution_options(synchronize_session=False)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "requests": self.requests,
+        }
+
+
+blynk_outbox = BlynkOutboxService()
@@ -4,58 +4,65 @@ from app.config import settings
 
 
 class BlynkService:
-    """Service untuk komunikasi dengan Blynk Cloud API"""
+    """
+    Service untuk komunikasi dengan Blynk Cloud API
+    
+    Pipeline tidak memanggil service ini langsung: write pin lewat blynk_outbox,
+    notifikasi lewat notification_aggregator (digest + rate limit)
+    """
+    
+    # Virtual pin dashboard
+    STATUS_PIN = "V0"
+    LARVA_COUNT_PIN = "V1"
     
     def __init__(self):
         self.auth_token = settings.BLYNK_AUTH_TOKEN
         self.base_url = "https://blynk.cloud/external/api"
+        # Shared client (keep-alive), dibuat di start() (startup event)
+        self.http_client: Optional[httpx.AsyncClient] = None
     
-    async def update_status(self, device_code: str, status: str) -> bool:
-        """
-        Update status device ke Blynk
-        status: "AMAN" atau "BAHAYA"
-        Virtual Pin V0 untuk status
-        """
-        if not self.auth_token:
-            print("⚠️  Blynk not configured, skipping update")
-            return False
-        
-        url = f"{self.base_url}/update"
-        
-        params = {
-            "token": self.auth_token,
-            "V0": status
-        }
-        
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                return True
-        except Exception as e:
-            print(f"Blynk update error: {str(e)}")
-            return False
+    def _build_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=settings.BLYNK_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.BLYNK_HTTP_MAX_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(settings.BLYNK_HTTP_TIMEOUT)
+        )
+    
+    async def start(self):
+        """Buat shared HTTP client (dipanggil di startup event)"""
+        if self.auth_token and self.http_client is None:
+            self.http_client = self._build_http_client()
+    
+    async def stop(self):
+        """Tutup koneksi (dipanggil di shutdown event)"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Shared client; dibuat lazy jika service dipakai tanpa startup event (script/test)"""
+        if self.http_client is None:
+            self.http_client = self._build_http_client()
+        return self.http_client
     
-    async def update_larva_count(self, count: int) -> bool:
+    async def update_pins(self, pins: Dict[str, Any]) -> bool:
         """
-        Update jumlah jentik ke Blynk
-        Virtual Pin V1 untuk count
+        Update beberapa virtual pin dalam satu request (/batch/update)
+        pins: {"V0": "BAHAYA", "V1": 12}
         """
         if not self.auth_token:
+            print("⚠️  Blynk not configured, skipping update")
             return False
         
-        url = f"{self.base_url}/update"
-        
-        params = {
-            "token": self.auth_token,
-            "V1": count
-        }
+        params = {"token": self.auth_token, **pins}
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                return True
+            response = await self._get_http_client().get("/batch/update", params=params)
+            response.raise_for_status()
+            return True
         except Exception as e:
             print(f"Blynk update error: {str(e)}")
             return False
@@ -67,38 +74,18 @@ class BlynkService:
         if not self.auth_token:
             return False
         
-        url = f"{self.base_url}/notify"
-        
         params = {
             "token": self.auth_token,
             "body": message
         }
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                return True
+            response = await self._get_http_client().get("/notify", params=params)
+            response.raise_for_status()
+            return True
         except Exception as e:
             print(f"Blynk notification error: {str(e)}")
             return False
-    
-    async def update_all(self, device_code: str, status: str, larva_count: int) -> Dict[str, bool]:
-        """
-        Update semua data ke Blynk sekaligus
-        """
-        results = {
-            "status_updated": await self.update_status(device_code, status),
-            "count_updated": await self.update_larva_count(larva_count)
-        }
-        
-        # Kirim notifikasi jika bahaya
-        if status == "BAHAYA":
-            results["notification_sent"] = await self.send_notification(
-                f"⚠️ PERINGATAN: Jentik terdeteksi di {device_code}! Jumlah: {larva_count}"
-            )
-        
-        return results
 
 
 blynk_service = BlynkService()
@@ -0,0 +1,80 @@
+"""
+Control State Cache - action otomatis per device untuk endpoint polling IoT
+
+Design Philosophy:
+- GET /device/{code}/control adalah request paling sering; tanpa cache setiap poll
+  query InferenceResult terbaru (ORDER BY inference_at) untuk action otomatis
+- Hanya action otomatis (dari inference terakhir) yang di-cache. Command manual
+  selalu dibaca dari DB (satu lookup baris DeviceControl per device): command PENDING
+  bisa dibuat / di-EXECUTED oleh proses lain, dan command basi dari cache membuat
+  servo dijalankan ulang
+- Write-through: pipeline inference meng-update entry setelah InferenceResult di-commit
+- Cache miss → caller load dari DB lalu fill(); version per device mencegah hasil
+  load yang sudah basi (write terjadi selama load) menimpa action terbaru
+- TTL membatasi staleness jika API berjalan di beberapa proses (write-through
+  hanya sampai ke cache proses yang menulis)
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+
+class ControlStateCache:
+    """Cache action otomatis per device_code, write-through + fallback DB saat miss"""
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=settings.CONTROL_STATE_CACHE_MAX_SIZE,
+            ttl_seconds=settings.CONTROL_STATE_CACHE_TTL_SECONDS
+        )
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Counters untuk monitoring
+        self.loads = 0
+        self.stale_loads = 0
+        self.write_throughs = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache.enabled
+
+    def get(self, device_code: str) -> Optional[str]:
+        """Returns: action otomatis (ACTIVATE_SERVO | STOP_SERVO) atau None (miss)"""
+        return self.cache.get(device_code)
+
+    def version(self, device_code: str) -> int:
+        """Ambil sebelum load dari DB, lalu berikan ke fill()"""
+        return self._versions.get(device_code, 0)
+
+    def fill(self, device_code: str, version: int, automatic_action: str) -> str:
+        """Simpan hasil load DB, kecuali ada write-through sejak version diambil"""
+        with self._lock:
+            self.loads += 1
+            if self._versions.get(device_code, 0) != version:
+                self.stale_loads += 1
+                return automatic_action
+            self.cache.set(device_code, automatic_action)
+        return automatic_action
+
+    def set_automatic_action(self, device_code: str, automatic_action: str):
+        """Write-through dari pipeline inference (setelah InferenceResult di-commit)"""
+        with self._lock:
+            self._versions[device_code] = self._versions.get(device_code, 0) + 1
+            self.write_throughs += 1
+            self.cache.set(device_code, automatic_action)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "loads": self.loads,
+            "stale_loads": self.stale_loads,
+            "write_throughs": self.write_throughs,
+            **self.cache.stats(),
+        }
+
+
+control_state_cache = ControlStateCache()
@@ -1,6 +1,7 @@
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 from app.models.alert import Alert
 from app.config import get_current_time
 
@@ -100,4 +101,99 @@ class DecisionEngine:
         return alert
 
 
+class AsyncDecisionEngine(DecisionEngine):
+    """
+    Versi async DecisionEngine untuk AsyncSession
+    determine_status / determine_action tetap sama (tanpa I/O)
+    """
+    
+    @staticmethod
+    async def should_create_alert(
+        device_code: str,
+        total_jentik: int,
+        db: AsyncSession
+    ) -> bool:
+        """
+        Tentukan apakah perlu membuat alert baru
+        Alert hanya dibuat jika:
+        - total_jentik > 0
+        - DAN belum ada alert yang belum resolved untuk device ini
+        """
+        if total_jentik == 0:
+            return False
+        
+        result = await db.execute(
+            select(Alert.id).where(
+                Alert.device_code == device_code,
+                Alert.resolved_at.is_(None)
+            ).limit(1)
+        )
+        
+        # Jika sudah ada alert yang belum resolved, jangan buat baru
+        return result.first() is None
+    
+    @staticmethod
+    async def resolve_alerts_if_safe(
+        device_code: str,
+        total_jentik: int,
+        db: AsyncSession,
+        commit: bool = True
+    ):
+        """
+        Resolve semua alert yang belum resolved jika kondisi sudah aman
+        commit=False: caller commit bersama perubahan lain (misal InferenceResult)
+        """
+        if total_jentik == 0:
+            await db.execute(
+                update(Alert).where(
+                    Alert.device_code == device_code,
+                    Alert.resolved_at.is_(None)
+                ).values(resolved_at=get_current_time())
+            )
+            if commit:
+                await db.commit()
+    
+    @staticmethod
+    async def create_alert(
+        device_id: str,
+        device_code: str,
+        total_jentik: int,
+        db: AsyncSession,
+        commit: bool = True
+    ) -> Alert:
+        """
+        Buat alert baru
+        commit=False: alert hanya ditambahkan ke session, caller yang commit
+        """
+        alert = Alert(
+            device_id=device_id,
+            device_code=device_code,
+            alert_type="LARVA_DETECTED",
+            alert_message=f"Terdeteksi {total_jentik} jentik nyamuk",
+            alert_level="critical"
+        )
+        db.add(alert)
+        if commit:
+            await db.commit()
+            await db.refresh(alert)
+        return alert
+    
+    async def apply_alerts(
+        self,
+        device_id: str,
+        device_code: str,
+        total_jentik: int,
+        db: AsyncSession
+    ):
+        """
+        Buat alert baru / resolve alert sesuai jumlah jentik, tanpa commit
+        Dipanggil pipeline inference sebelum commit InferenceResult: alert tersimpan
+        atomik bersama hasil inference (tidak hilang saat proses restart)
+        """
+        if await self.should_create_alert(device_code, total_jentik, db):
+            await self.create_alert(device_id, device_code, total_jentik, db, commit=False)
+        await self.resolve_alerts_if_safe(device_code, total_jentik, db, commit=False)
+
+
 decision_engine = DecisionEngine()
+async_decision_engine = AsyncDecisionEngine()
@@ -0,0 +1,104 @@
+"""
+Decision Events - subscriber untuk keputusan inference (topic inference.decision)
+
+Design Philosophy:
+- Pipeline inference menyimpan InferenceResult + alert + outbox Blynk dalam satu transaksi,
+  lalu publish satu event keputusan ke event_bus; efek samping best-effort berjalan
+  di subscriber (event bisa dibuang saat queue penuh / hilang saat restart, jadi
+  efek yang harus durable tidak boleh hanya ada di subscriber)
+- blynk: bangunkan flusher outbox (value pin sudah durable di tabel blynk_outbox,
+  flusher tetap polling jika event terlewat)
+- notifications: event BAHAYA ke notification_aggregator (digest + rate limit)
+- metrics: hitung keputusan per status / action untuk /api/metrics
+- Consumer baru cukup subscribe ke DECISION_TOPIC, tanpa mengubah pipeline
+"""
+
+from typing import Any, Dict, Optional
+
+from app.config import get_current_time
+from app.services.blynk_outbox import blynk_outbox
+from app.services.event_bus import EventBus, event_bus
+from app.services.notification_aggregator import notification_aggregator
+
+
+DECISION_TOPIC = "inference.decision"
+
+
+def build_decision_event(
+    inference_result_id: str,
+    image_id: str,
+    device_id: str,
+    device_code: str,
+    status: str,
+    action: str,
+    total_jentik: int,
+    is_manipulated: bool = False,
+    reuse_reason: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "inference_result_id": inference_result_id,
+        "image_id": image_id,
+        "device_id": device_id,
+        "device_code": device_code,
+        "status": status,
+        "action": action,
+        "total_jentik": total_jentik,
+        "is_manipulated": is_manipulated,
+        "reuse_reason": reuse_reason,
+        "decided_at": get_current_time().isoformat(),
+    }
+
+
+async def handle_blynk_sync(event: Dict[str, Any]):
+    """Value pin sudah ditulis ke outbox bersama InferenceResult; minta flusher kirim sekarang"""
+    blynk_outbox.wake()
+
+
+async def handle_notifications(event: Dict[str, Any]):
+    """Notifikasi Blynk: digabung jadi digest per window + rate limit"""
+    if event["status"] == "BAHAYA":
+        notification_aggregator.add(event["device_code"], event["total_jentik"])
+
+
+class DecisionMetrics:
+    """Counter keputusan inference (subscriber metrics)"""
+
+    def __init__(self):
+        self.decisions = 0
+        self.by_status: Dict[str, int] = {}
+        self.by_action: Dict[str, int] = {}
+        self.manipulated = 0
+        self.reused = 0
+        self.last_decision_at: Optional[str] = None
+
+    async def handle(self, event: Dict[str, Any]):
+        self.decisions += 1
+        self.by_status[event["status"]] = self.by_status.get(event["status"], 0) + 1
+        self.by_action[event["action"]] = self.by_action.get(event["action"], 0) + 1
+        if event["is_manipulated"]:
+            self.manipulated += 1
+        if event["reuse_reason"]:
+            self.reused += 1
+        self.last_decision_at = event["decided_at"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "decisions": self.decisions,
+            "by_status": dict(self.by_status),
+            "by_action": dict(self.by_action),
+            "manipulated": self.manipulated,
+            "reused": self.reused,
+            "last_decision_at": self.last_decision_at,
+        }
+
+
+decision_metrics = DecisionMetrics()
+
+
+def register_decision_subscribers(bus: EventBus = event_bus):
+    """Daftarkan subscriber keputusan inference (dipanggil di startup event)"""
+    if bus.subscribers(DECISION_TOPIC):
+        return
+    bus.subscribe(DECISION_TOPIC, "blynk", handle_blynk_sync)
+    bus.subscribe(DECISION_TOPIC, "notifications", handle_notifications)
+    bus.subscribe(DECISION_TOPIC, "metrics", decision_metrics.handle)
@@ -0,0 +1,226 @@
+"""
+Event Bus - pub/sub in-process untuk fan-out event pipeline
+
+Design Philosophy:
+- Publisher (pipeline inference) hanya memasukkan event ke queue subscriber lalu lanjut;
+  consumer baru tidak menambah panjang critical path
+- Setiap subscriber punya queue bounded dan worker sendiri → subscriber lambat
+  (mis. Blynk sedang lambat) tidak menahan subscriber lain
+- Queue penuh → event untuk subscriber tersebut dibuang dan dihitung (dropped),
+  publish tidak pernah menunggu
+- Subscriber dengan partition_key: event dengan key sama selalu ke worker yang sama
+  → urutan per key (mis. per device) tetap terjaga walau concurrency > 1
+- Exception handler dicatat per subscriber, tidak menghentikan worker
+- State di memory per proses (best effort); data yang harus durable (hasil inference,
+  alert, outbox Blynk) ditulis di transaksi publisher sebelum publish
+"""
+
+import asyncio
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+PartitionKey = Callable[[Dict[str, Any]], str]
+
+
+class Subscription:
+    """Satu subscriber: handler + queue bounded + worker"""
+
+    def __init__(
+        self,
+        topic: str,
+        name: str,
+        handler: EventHandler,
+        queue_size: int,
+        concurrency: int,
+        partition_key: Optional[PartitionKey] = None
+    ):
+        self.topic = topic
+        self.name = name
+        self.handler = handler
+        self.queue_size = max(1, queue_size)
+        self.concurrency = max(1, concurrency)
+        self.partition_key = partition_key
+
+        # Tanpa partition_key semua worker berbagi satu queue;
+        # dengan partition_key setiap worker punya queue sendiri
+        queue_count = self.concurrency if partition_key else 1
+        per_queue = max(1, self.queue_size // queue_count)
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=per_queue) for _ in range(queue_count)]
+        self.workers: List[asyncio.Task] = []
+
+        # Counters untuk monitoring
+        self.delivered = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_lag_ms = 0.0
+
+    def _queue_for(self, event: Dict[str, Any]) -> asyncio.Queue:
+        if len(self.queues) == 1:
+            return self.queues[0]
+        key = str(self.partition_key(event))
+        return self.queues[zlib.crc32(key.encode()) % len(self.queues)]
+
+    def offer(self, event: Dict[str, Any], published_at: float) -> bool:
+        try:
+            self._queue_for(event).put_nowait((event, published_at))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.delivered += 1
+        return True
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def start(self):
+        if self.workers:
+            return
+        self.workers = [
+            asyncio.create_task(
+                self._worker(self.queues[i % len(self.queues)]),
+                name=f"event-{self.name}-{i}"
+            )
+            for i in range(self.concurrency)
+        ]
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            event, published_at = await queue.get()
+            self.max_lag_ms = max(self.max_lag_ms, (time.monotonic() - published_at) * 1000)
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"✗ Event subscriber '{self.name}' error: {str(e)}")
+            finally:
+                queue.task_done()
+
+    async def drain(self):
+        await asyncio.gather(*(queue.join() for queue in self.queues))
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topic": self.topic,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "pending": self.pending(),
+            "delivered": self.delivered,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+
+class EventBus:
+    """Pub/sub in-process: publish non-blocking, fan-out ke queue setiap subscriber"""
+
+    def __init__(self):
+        self.default_queue_size = settings.EVENT_BUS_QUEUE_SIZE
+        self.drain_timeout = settings.EVENT_BUS_DRAIN_TIMEOUT_SECONDS
+        self._subscriptions: Dict[str, List[Subscription]] = {}
+        self._running = False
+
+        # Counters untuk monitoring
+        self.published: Dict[str, int] = {}
+
+    def subscribe(
+        self,
+        topic: str,
+        name: str,
+        handler: EventHandler,
+        queue_size: Optional[int] = None,
+        concurrency: int = 1,
+        partition_key: Optional[PartitionKey] = None
+    ) -> Subscription:
+        """
+        Daftarkan handler untuk topic
+        Subscriber yang didaftarkan setelah start() langsung mendapat worker
+        """
+        if any(sub.name == name for subs in self._subscriptions.values() for sub in subs):
+            raise ValueError(f"Subscriber '{name}' already registered")
+
+        subscription = Subscription(
+            topic,
+            name,
+            handler,
+            queue_size or self.default_queue_size,
+            concurrency,
+            partition_key
+        )
+        self._subscriptions.setdefault(topic, []).append(subscription)
+        if self._running:
+            subscription.start()
+        return subscription
+
+    def subscribers(self, topic: str) -> List[str]:
+        return [sub.name for sub in self._subscriptions.get(topic, [])]
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> int:
+        """
+        Kirim event ke semua subscriber topic tanpa menunggu handler
+        Returns: jumlah subscriber yang menerima event (queue tidak penuh)
+        """
+        self.published[topic] = self.published.get(topic, 0) + 1
+        published_at = time.monotonic()
+        return sum(
+            1 for subscription in self._subscriptions.get(topic, [])
+            if subscription.offer(event, published_at)
+        )
+
+    def _all(self) -> List[Subscription]:
+        return [sub for subs in self._subscriptions.values() for sub in subs]
+
+    async def start(self):
+        """Start worker semua subscriber (dipanggil di startup event)"""
+        if self._running:
+            return
+        self._running = True
+        subscriptions = self._all()
+        for subscription in subscriptions:
+            subscription.start()
+        print(f"✓ Event bus started ({len(subscriptions)} subscribers)")
+
+    async def stop(self):
+        """
+        Tunggu event yang masih di queue diproses (maks drain_timeout), lalu stop worker
+        Dipanggil setelah publisher (scheduler) berhenti
+        """
+        if not self._running:
+            return
+        subscriptions = self._all()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(sub.drain() for sub in subscriptions)),
+                timeout=self.drain_timeout
+            )
+        except asyncio.TimeoutError:
+            pending = sum(sub.pending() for sub in subscriptions)
+            print(f"⚠️  Event bus stopped with {pending} unprocessed events")
+        for subscription in subscriptions:
+            await subscription.stop()
+        self._running = False
+        print("✓ Event bus stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "published": dict(self.published),
+            "subscribers": {sub.name: sub.stats() for sub in self._all()},
+        }
+
+
+event_bus = EventBus()
@@ -0,0 +1,134 @@
+"""
+Idempotency Service - replay upload ESP32 tanpa proses ulang
+
+Design Philosophy:
+- ESP32 di area sinyal buruk sering mengirim ulang upload karena response hilang
+- Key per device: header Idempotency-Key, atau diturunkan dari (captured_at, checksum)
+- Key + response disimpan di tabel idempotency_keys dalam transaksi yang sama
+  dengan baris Image (unique constraint = sumber kebenaran)
+- TTLCache kecil di depan tabel untuk key terbaru (retry biasanya dalam hitungan detik)
+- Retensi: key lebih tua dari IDEMPOTENCY_RETENTION_SECONDS dihapus berkala dalam batch
+  kecil (dipanggil dari loop worker inference scheduler), jadi tabel tidak tumbuh selamanya
+"""
+
+import hashlib
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings, get_current_time
+from app.models.idempotency_key import IdempotencyKey
+from app.utils.cache import TTLCache
+
+
+class IdempotencyService:
+    """Lookup & pencatatan idempotency key upload"""
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=settings.IDEMPOTENCY_CACHE_MAX_SIZE,
+            ttl_seconds=settings.IDEMPOTENCY_CACHE_TTL_SECONDS
+        )
+        self.retention_seconds = settings.IDEMPOTENCY_RETENTION_SECONDS
+        self.purge_batch_size = max(1, settings.IDEMPOTENCY_PURGE_BATCH_SIZE)
+        self.replays = 0
+        self.purged = 0
+
+    @staticmethod
+    def derive_key(captured_at: Optional[str], checksum: str) -> Optional[str]:
+        """
+        Key default dari (captured_at, checksum) - device di-scope lewat device_id
+        Tanpa captured_at dari device tidak ada key (waktu server selalu berbeda)
+        captured_at dari form tidak dibatasi panjangnya, jadi di-hash: key selalu
+        muat di kolom idempotency_key (VARCHAR 255)
+        """
+        if not captured_at or not captured_at.strip():
+            return None
+        digest = hashlib.sha256(f"{captured_at.strip()}:{checksum}".encode()).hexdigest()
+        return f"auto:{digest}"
+
+    async def lookup(self, db: AsyncSession, device_id: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Cari response tersimpan untuk key ini
+        Returns: response (dict) atau None jika key belum pernah dipakai
+        """
+        cached = self.cache.get((device_id, key))
+        if cached is not None:
+            self.replays += 1
+            return cached
+
+        response = await db.scalar(
+            select(IdempotencyKey.response).where(
+                IdempotencyKey.device_id == device_id,
+                IdempotencyKey.idempotency_key == key
+            )
+        )
+        if response is None:
+            return None
+
+        self.cache.set((device_id, key), response)
+        self.replays += 1
+        return response
+
+    def record(
+        self,
+        db: AsyncSession,
+        device_id: str,
+        key: str,
+        image_id: str,
+        response: Dict[str, Any]
+    ) -> IdempotencyKey:
+        """
+        Tambah key ke session (tanpa commit)
+        Caller commit bersama baris Image; IntegrityError = request lain dengan key sama menang
+        """
+        record = IdempotencyKey(
+            device_id=device_id,
+            idempotency_key=key,
+            image_id=image_id,
+            response=response
+        )
+        db.add(record)
+        return record
+
+    def remember(self, device_id: str, key: str, response: Dict[str, Any]):
+        """Simpan ke cache setelah commit berhasil"""
+        self.cache.set((device_id, key), response)
+
+    async def purge_expired(self, db: AsyncSession) -> int:
+        """
+        Hapus key yang lebih tua dari retensi, per batch (commit per batch agar lock singkat)
+        Returns: jumlah baris yang dihapus
+        """
+        if self.retention_seconds <= 0:
+            return 0
+
+        cutoff = get_current_time() - timedelta(seconds=self.retention_seconds)
+        total = 0
+        while True:
+            ids = (await db.scalars(
+                select(IdempotencyKey.id).where(IdempotencyKey.created_at < cutoff).limit(self.purge_batch_size)
+            )).all()
+            if not ids:
+                break
+            await db.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)))
+            await db.commit()
+            total += len(ids)
+            if len(ids) < self.purge_batch_size:
+                break
+
+        self.purged += total
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replays": self.replays,
+            "purged": self.purged,
+            "retention_seconds": self.retention_seconds,
+            "cache": self.cache.stats(),
+        }
+
+
+idempotency_service = IdempotencyService()
@@ -0,0 +1,483 @@
+"""
+Inference Backends - abstraksi engine inference di belakang RoboflowService
+
+Design Philosophy:
+- Semua backend punya interface sama: infer(image_path) → raw prediction
+- Raw prediction selalu berbentuk hasil Roboflow (workflow list / detection dict)
+  sehingga parse_prediction, cache, dan raw_prediction di database tidak berubah
+- roboflow: Workflow (inference_sdk / httpx) atau Detection API, lewat shared HTTP client
+- local: model ONNX (export YOLO) via OpenCV DNN di process pool - tanpa network & biaya per call
+- stub: hasil deterministik dari checksum image - untuk test & benchmark offline
+"""
+
+import asyncio
+import functools
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.utils.batching import MicroBatcher
+from app.utils.detection_utils import detect_objects, init_detection_worker
+from app.utils.image_utils import read_file
+
+# Try to import inference_sdk, fallback to httpx
+try:
+    from inference_sdk import InferenceHTTPClient
+    HAS_INFERENCE_SDK = True
+except ImportError:
+    HAS_INFERENCE_SDK = False
+
+# HTTP/2 di httpx butuh package h2 (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+
+class InferenceBackend:
+    """Interface backend inference"""
+
+    name = "base"
+    # True = request lewat network (hedging relevan)
+    remote = False
+    # True = request yang di-cancel benar-benar berhenti (coroutine async);
+    # False = berjalan di thread executor dan tetap selesai walau awaiter di-cancel
+    cancellable = True
+
+    @property
+    def model_key(self) -> str:
+        """Identitas model aktif (bagian dari key cache inference)"""
+        raise NotImplementedError
+
+    async def start(self):
+        """Siapkan resource (dipanggil di startup event)"""
+
+    async def stop(self):
+        """Lepas resource (dipanggil di shutdown event)"""
+
+    async def infer(self, image_path: str) -> Any:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "model": self.model_key}
+
+
+class RoboflowBackend(InferenceBackend):
+    """Basis backend Roboflow: shared httpx.AsyncClient (keep-alive) per proses"""
+
+    remote = True
+
+    def __init__(self, api_key: str, base_url: str):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """
+        Satu AsyncClient per proses: koneksi keep-alive dipakai ulang antar inference
+        (tanpa DNS + TCP + TLS handshake per image)
+        """
+        self.http2 = settings.ROBOFLOW_HTTP2 and HAS_HTTP2
+        if settings.ROBOFLOW_HTTP2 and not HAS_HTTP2:
+            print("⚠️  ROBOFLOW_HTTP2 enabled but h2 not installed (pip install httpx[http2]), using HTTP/1.1")
+
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.ROBOFLOW_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ROBOFLOW_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.ROBOFLOW_HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                settings.ROBOFLOW_READ_TIMEOUT,
+                connect=settings.ROBOFLOW_CONNECT_TIMEOUT
+            )
+        )
+
+    async def start(self):
+        if self.http_client is None:
+            self.http_client = self._build_http_client()
+        print(f"✓ Roboflow HTTP client ready (max {settings.ROBOFLOW_HTTP_MAX_CONNECTIONS} connections, HTTP/2: {'✓' if self.http2 else '✗'})")
+
+    async def stop(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        print("✓ Roboflow HTTP client closed")
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Shared client; dibuat lazy jika service dipakai tanpa startup event (script/test)"""
+        if self.http_client is None:
+            self.http_client = self._build_http_client()
+        return self.http_client
+
+    async def infer(self, image_path: str) -> Any:
+        if not self.api_key:
+            raise Exception("Roboflow API key not configured")
+        return await self._infer(image_path)
+
+    async def _infer(self, image_path: str) -> Any:
+        raise NotImplementedError
+
+
+class RoboflowWorkflowBackend(RoboflowBackend):
+    """Roboflow Workflows (returns list atau dict) via inference_sdk, fallback httpx"""
+
+    name = "roboflow_workflow"
+
+    def __init__(self, api_key: str, workspace: str, workflow_id: str):
+        super().__init__(api_key, "https://serverless.roboflow.com")
+        self.workspace = workspace
+        self.workflow_id = workflow_id
+        self.client = None
+        self.sdk_executor: Optional[ThreadPoolExecutor] = None
+        self.workflow_batcher: Optional[MicroBatcher] = None
+
+        if HAS_INFERENCE_SDK:
+            self.client = InferenceHTTPClient(api_url=self.base_url, api_key=self.api_key)
+            print(f"   Mode: Workflow (inference_sdk) ✓")
+
+            # Micro-batching call workflow SDK (run_workflow menerima banyak image sekaligus)
+            if settings.ROBOFLOW_BATCH_WINDOW_MS > 0 and settings.ROBOFLOW_BATCH_MAX_SIZE > 1:
+                self.workflow_batcher = MicroBatcher(
+                    self._run_workflow_batch,
+                    max_size=settings.ROBOFLOW_BATCH_MAX_SIZE,
+                    window_seconds=settings.ROBOFLOW_BATCH_WINDOW_MS / 1000
+                )
+                print(f"   Batching: ✓ (max {settings.ROBOFLOW_BATCH_MAX_SIZE} images / {settings.ROBOFLOW_BATCH_WINDOW_MS} ms)")
+        else:
+            print(f"   Mode: Workflow (httpx) ✓")
+
+    @property
+    def model_key(self) -> str:
+        return f"workflow:{self.workspace}/{self.workflow_id}"
+
+    @property
+    def cancellable(self) -> bool:
+        # Call SDK berjalan di sdk_executor: cancel hanya melepas awaiter, request tetap jalan
+        return self.client is None
+
+    async def start(self):
+        await super().start()
+        if self.sdk_executor is None and self.client:
+            # Executor khusus agar call SDK (blocking) tidak menghabiskan default executor
+            self.sdk_executor = ThreadPoolExecutor(
+                max_workers=settings.ROBOFLOW_SDK_WORKERS,
+                thread_name_prefix="roboflow-sdk"
+            )
+
+    async def stop(self):
+        await super().stop()
+        if self.sdk_executor is not None:
+            self.sdk_executor.shutdown(wait=True, cancel_futures=True)
+            self.sdk_executor = None
+
+    async def _infer(self, image_path: str) -> Any:
+        if self.client:
+            return await self._infer_workflow_sdk(image_path)
+        return await self._infer_workflow_httpx(image_path)
+
+    async def _infer_workflow_sdk(self, image_path: str) -> Any:
+        """Inference using inference_sdk (returns list atau dict)"""
+        try:
+            if self.workflow_batcher:
+                # Digabung dengan image lain yang masuk dalam window batch yang sama
+                result = await self.workflow_batcher.submit(image_path)
+            else:
+                result = await self._run_workflow_sdk(image_path)
+
+            # Return full result (list atau dict) tanpa parsing
+            # Biar raw_prediction tersimpan lengkap di database
+            return result
+
+        except Exception as e:
+            print(f"   ✗ Workflow error: {str(e)}")
+            raise Exception(f"Roboflow Workflow error: {str(e)}")
+
+    async def _run_workflow_sdk(self, images: Any) -> Any:
+        """Satu call run_workflow di executor SDK (images: path atau list path)"""
+        batch_note = f" ({len(images)} images)" if isinstance(images, list) else ""
+        print(f"   🔄 Running workflow (SDK): {self.workspace}/{self.workflow_id}{batch_note}")
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.sdk_executor,  # None = default executor (tanpa startup event)
+            functools.partial(
+                self.client.run_workflow,
+                workspace_name=self.workspace,
+                workflow_id=self.workflow_id,
+                images={"image": images},
+                use_cache=False
+            )
+        )
+        print(f"   ✓ Workflow completed successfully")
+        return result
+
+    async def _run_workflow_batch(self, image_paths: List[str]) -> List[Any]:
+        """
+        batch_fn untuk workflow_batcher
+        Satu image: call biasa. Banyak image: satu run_workflow multi-image,
+        hasil (satu dict per image, urutan sama) dibungkus list agar bentuknya
+        sama dengan hasil single-image → parse_prediction tidak berubah
+
+        Jika call batch gagal, setiap image dicoba sendiri-sendiri agar satu image
+        bermasalah tidak menggagalkan job lain di batch yang sama
+        """
+        if len(image_paths) == 1:
+            return [await self._run_workflow_sdk(image_paths[0])]
+
+        try:
+            result = await self._run_workflow_sdk(list(image_paths))
+            if not isinstance(result, list) or len(result) != len(image_paths):
+                raise ValueError(f"unexpected batch result for {len(image_paths)} images")
+            return [[item] for item in result]
+        except Exception as e:
+            print(f"   ⚠️  Workflow batch failed ({str(e)}), retrying {len(image_paths)} images individually")
+            return await asyncio.gather(
+                *(self._run_workflow_sdk(path) for path in image_paths),
+                return_exceptions=True
+            )
+
+    async def _infer_workflow_httpx(self, image_path: str) -> Any:
+        """Inference using httpx directly (returns list atau dict)"""
+        url = f"{self.base_url}/{self.workspace}/{self.workflow_id}"
+
+        try:
+            print(f"   🔄 Running workflow (httpx): {self.workspace}/{self.workflow_id}")
+            image_data = await asyncio.to_thread(read_file, image_path)
+            files = {
+                'image': ('image.jpg', image_data, 'image/jpeg')
+            }
+            params = {
+                'api_key': self.api_key
+            }
+            response = await self._get_http_client().post(url, files=files, params=params)
+            response.raise_for_status()
+            result = response.json()
+
+            print(f"   ✓ Workflow completed successfully")
+            return result
+
+        except httpx.HTTPError as e:
+            print(f"   ✗ Workflow HTTP error: {str(e)}")
+            raise Exception(f"Roboflow Workflow API error: {str(e)}")
+        except Exception as e:
+            print(f"   ✗ Workflow error: {str(e)}")
+            raise Exception(f"Workflow inference error: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "workflow_batcher": self.workflow_batcher.stats() if self.workflow_batcher else None,
+        }
+
+
+class RoboflowDetectionBackend(RoboflowBackend):
+    """Roboflow Detection API (legacy, returns dict)"""
+
+    name = "roboflow_detection"
+
+    def __init__(self, api_key: str, model_id: str, version: int):
+        super().__init__(api_key, "https://detect.roboflow.com")
+        self.model_id = model_id
+        self.version = version
+        print(f"   Mode: Detection ✓")
+
+    @property
+    def model_key(self) -> str:
+        return f"detection:{self.model_id}/{self.version}"
+
+    async def _infer(self, image_path: str) -> Dict[str, Any]:
+        url = f"{self.base_url}/{self.model_id}/{self.version}"
+
+        params = {
+            "api_key": self.api_key,
+            "confidence": 40,
+            "overlap": 30
+        }
+
+        try:
+            image_data = await asyncio.to_thread(read_file, image_path)
+            files = {'file': ('image.jpg', image_data, 'image/jpeg')}
+            response = await self._get_http_client().post(url, params=params, files=files)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            raise Exception(f"Roboflow API error: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Inference error: {str(e)}")
+
+
+class UnconfiguredBackend(InferenceBackend):
+    """Roboflow belum dikonfigurasi - setiap inference gagal dengan pesan jelas"""
+
+    name = "unconfigured"
+
+    def __init__(self, error_message: str):
+        self.error_message = error_message
+
+    @property
+    def model_key(self) -> str:
+        return "unconfigured"
+
+    async def infer(self, image_path: str) -> Any:
+        raise Exception(self.error_message)
+
+
+class LocalDnnBackend(InferenceBackend):
+    """
+    Model ONNX (export YOLO) dijalankan lokal dengan OpenCV DNN
+    Inference CPU-heavy → ProcessPoolExecutor (spawn), model di-load sekali per worker
+    (fallback tanpa pool: satu net per thread); file model diganti → worker load ulang
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.model_path = settings.LOCAL_MODEL_PATH
+        self.class_names = [name.strip() for name in settings.LOCAL_MODEL_CLASSES.split(",") if name.strip()]
+        self.input_size = settings.LOCAL_MODEL_INPUT_SIZE
+        self.confidence = settings.LOCAL_MODEL_CONFIDENCE
+        self.nms_threshold = settings.LOCAL_MODEL_NMS_THRESHOLD
+        self.worker_count = settings.LOCAL_INFERENCE_WORKERS
+        self.opencv_threads = settings.LOCAL_INFERENCE_OPENCV_THREADS
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        if not self.model_path:
+            raise ValueError("INFERENCE_BACKEND=local requires LOCAL_MODEL_PATH")
+        if not self.class_names:
+            raise ValueError("INFERENCE_BACKEND=local requires LOCAL_MODEL_CLASSES")
+        print(f"   Mode: Local DNN ({os.path.basename(self.model_path)}, classes: {', '.join(self.class_names)}) ✓")
+
+    @property
+    def model_key(self) -> str:
+        # File model diganti (ukuran / mtime berubah) → cache lama tidak terpakai
+        try:
+            stat = os.stat(self.model_path)
+            version = f"{stat.st_size}-{int(stat.st_mtime)}"
+        except OSError:
+            version = "missing"
+        return f"local:{os.path.basename(self.model_path)}:{version}"
+
+    async def start(self):
+        if self._executor or self.worker_count <= 0:
+            return
+
+        # spawn: aman untuk proses yang sudah punya thread (uvicorn, OpenCV)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.worker_count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_detection_worker,
+            initargs=(self.opencv_threads, self.model_path)
+        )
+        print(f"✓ Local inference pool started ({self.worker_count} processes, {self.opencv_threads} OpenCV threads each)")
+
+    async def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            print("✓ Local inference pool stopped")
+
+    async def infer(self, image_path: str) -> Dict[str, Any]:
+        image_data = await asyncio.to_thread(read_file, image_path)
+        detect = functools.partial(
+            detect_objects,
+            image_data,
+            self.model_path,
+            self.class_names,
+            self.input_size,
+            self.confidence,
+            self.nms_threshold
+        )
+        if self._executor is None:
+            # Pool nonaktif (LOCAL_INFERENCE_WORKERS=0 / tanpa startup event) - tetap jangan blokir event loop
+            return await asyncio.to_thread(detect)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, detect)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "workers": self.worker_count if self._executor else 0,
+        }
+
+
+class StubBackend(InferenceBackend):
+    """
+    Backend deterministik untuk test & benchmark offline
+    Hasil diturunkan dari SHA-256 isi file: image sama → prediksi sama
+    """
+
+    name = "stub"
+
+    def __init__(self):
+        self.latency_seconds = settings.INFERENCE_STUB_LATENCY_MS / 1000
+        print(f"   Mode: Stub (deterministic, {settings.INFERENCE_STUB_LATENCY_MS} ms latency) ✓")
+
+    @property
+    def model_key(self) -> str:
+        return "stub:v1"
+
+    async def infer(self, image_path: str) -> Dict[str, Any]:
+        image_data = await asyncio.to_thread(read_file, image_path)
+        if self.latency_seconds > 0:
+            await asyncio.sleep(self.latency_seconds)
+
+        digest = hashlib.sha256(image_data).digest()
+        larva_count = digest[0] % 16
+        other_count = digest[1] % 4
+        predictions = []
+        for i in range(larva_count + other_count):
+            predictions.append({
+                "x": float(digest[(i + 2) % 32]),
+                "y": float(digest[(i + 3) % 32]),
+                "width": 10.0,
+                "height": 10.0,
+                "confidence": round(0.5 + digest[(i + 4) % 32] / 512, 4),
+                "class": "jentik" if i < larva_count else "other",
+                "class_id": 0 if i < larva_count else 1,
+            })
+        return {"image": {"width": 640, "height": 480}, "predictions": predictions}
+
+
+def create_inference_backend() -> InferenceBackend:
+    """Pilih backend dari INFERENCE_BACKEND (roboflow: workflow/detection sesuai config)"""
+    backend_name = settings.INFERENCE_BACKEND
+
+    if backend_name == "local":
+        return LocalDnnBackend()
+    if backend_name == "stub":
+        return StubBackend()
+    if backend_name != "roboflow":
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {backend_name}")
+
+    if settings.ROBOFLOW_WORKSPACE and settings.ROBOFLOW_WORKFLOW_ID:
+        return RoboflowWorkflowBackend(
+            settings.ROBOFLOW_API_KEY,
+            settings.ROBOFLOW_WORKSPACE,
+            settings.ROBOFLOW_WORKFLOW_ID
+        )
+    if settings.ROBOFLOW_MODEL_ID:
+        return RoboflowDetectionBackend(
+            settings.ROBOFLOW_API_KEY,
+            settings.ROBOFLOW_MODEL_ID,
+            settings.ROBOFLOW_VERSION or 1
+        )
+
+    print(f"   Mode: ✗ NOT CONFIGURED")
+    print(f"   ⚠️  Need either (workspace + workflow_id) OR model_id")
+    return UnconfiguredBackend(
+        "Roboflow not properly configured. "
+        f"API Key: {'✓' if settings.ROBOFLOW_API_KEY else '✗'}, "
+        f"Workspace: {settings.ROBOFLOW_WORKSPACE or '✗'}, "
+        f"Workflow ID: {settings.ROBOFLOW_WORKFLOW_ID or '✗'}, "
+        f"Model ID: {settings.ROBOFLOW_MODEL_ID or '✗'}, "
+        f"inference_sdk: {'✓' if HAS_INFERENCE_SDK else '✗ (run: pip install inference-sdk)'}"
+    )
@@ -0,0 +1,165 @@
+"""
+Inference Cache - cache hasil inference per (model, checksum image preprocessed)
+
+Design Philosophy:
+- Image preprocessed yang sama + model yang sama = hasil Roboflow yang sama,
+  jadi retry job, reprocessing dan frame duplikat tidak perlu bayar latency & kuota lagi
+- Memory: TTLCache (LRU + TTL), opsional persist ke disk (satu file JSON per key)
+  agar cache tetap hangat setelah restart
+- Singleflight: request paralel untuk key yang sama menunggu satu request yang sedang berjalan
+- Error tidak di-cache (job akan retry dengan backoff)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.utils.cache import TTLCache
+from app.utils.image_utils import ensure_directory_exists
+
+
+class InferenceCache:
+    """LRU/TTL cache + disk opsional + in-flight request coalescing"""
+
+    def __init__(self):
+        self.ttl_seconds = settings.INFERENCE_CACHE_TTL_SECONDS
+        self.memory = TTLCache(
+            max_size=settings.INFERENCE_CACHE_MAX_SIZE,
+            ttl_seconds=self.ttl_seconds
+        )
+        self.disk_dir = settings.INFERENCE_CACHE_DIR
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # Counters untuk monitoring
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _disk_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.json")
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        """Returns: (value, sisa ttl detik) atau None jika tidak ada / expired"""
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        remaining = entry.get("created_at", 0) + self.ttl_seconds - time.time()
+        if entry.get("key") != key or remaining <= 0:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return entry["value"], remaining
+
+    def _write_disk(self, key: str, value: Any):
+        path = self._disk_path(key)
+        ensure_directory_exists(os.path.dirname(path))
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"key": key, "created_at": time.time(), "value": value}, f)
+        os.replace(temp_path, path)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Ambil hasil dari memory, lalu disk (jika diaktifkan)"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                value, remaining = entry
+                self.memory.set(key, value, ttl_seconds=remaining)
+                self.disk_hits += 1
+                return value
+
+        return None
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, value)
+            except (OSError, TypeError, ValueError) as e:
+                # Hasil tidak bisa di-serialize / disk penuh - cache memory tetap jalan
+                print(f"⚠️  Inference cache disk write failed: {str(e)}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Ambil dari cache, atau jalankan compute sekali untuk semua pemanggil paralel dengan key sama
+        timeout: batas tunggu (detik) pemanggil yang menumpang request yang sedang berjalan;
+                 pemanggil pertama dibatasi oleh compute sendiri. Raise TimeoutError jika lewat
+        """
+        if not self.enabled:
+            return await compute()
+
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            # shield: pemanggil yang di-cancel / timeout tidak membatalkan request milik pemanggil lain
+            try:
+                return await asyncio.wait_for(asyncio.shield(inflight), timeout=timeout)
+            except asyncio.TimeoutError:
+                if inflight.done():
+                    # Request pemilik sendiri gagal karena timeout
+                    raise
+                raise TimeoutError(f"Timed out after {timeout:.1f}s waiting for in-flight inference")
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            await self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Hindari warning "exception was never retrieved" jika tidak ada yang menunggu
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "memory": self.memory.stats(),
+            "disk_dir": self.disk_dir,
+        }
+
+
+inference_cache = InferenceCache()
@@ -0,0 +1,307 @@
+"""
+Inference Scheduler - bounded worker pool untuk inference background
+
+Design Philosophy:
+- Job disimpan durable di tabel inference_jobs (lihat job_queue)
+- Queue asyncio lokal hanya berisi hint job_id agar job baru langsung dikerjakan;
+  worker juga polling tabel sehingga job dari restart/proses lain tetap diambil
+- Jumlah worker tetap → jumlah request Roboflow & koneksi DB terbatas
+- Session claim ditutup sebelum handler jalan; handler membuka session sendiri dan
+  complete/fail/release memakai session baru yang singkat
+- Lease diperpanjang (heartbeat) selama handler berjalan; jika lease ternyata sudah
+  diambil alih worker lain, handler dibatalkan dan hasil attempt ini dibuang
+- Shutdown menunggu job yang sedang berjalan (graceful drain) sebelum worker dihentikan;
+  job yang belum selesai di-claim ulang setelah lease habis
+- Housekeeping berkala (purge idempotency key kadaluarsa, dead-letter job yang lease-nya
+  habis di attempt terakhir) dijalankan oleh worker yang sedang idle,
+  maksimal sekali per interval per proses
+- Circuit breaker provider open → job dikembalikan ke queue tanpa menghitung attempt,
+  dijadwalkan ulang setelah circuit boleh dicoba lagi
+"""
+
+import asyncio
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.inference_job import InferenceJob
+from app.services.idempotency_service import idempotency_service
+from app.services.job_queue import LeaseLostError, job_queue
+from app.services.resilience import CircuitOpenError
+
+
+JobHandler = Callable[[InferenceJob], Awaitable[Any]]
+DeadJobHandler = Callable[[InferenceJob, str], Awaitable[Any]]
+
+
+class InferenceScheduler:
+    """Fixed worker pool yang meng-claim job dari tabel inference_jobs"""
+
+    def __init__(self):
+        self.worker_count = max(1, settings.INFERENCE_WORKERS)
+        self.max_queue_size = settings.INFERENCE_QUEUE_MAX_SIZE
+        self.full_policy = settings.INFERENCE_QUEUE_FULL_POLICY  # defer | shed
+        self.enqueue_timeout = settings.INFERENCE_ENQUEUE_TIMEOUT_SECONDS
+        self.shutdown_timeout = settings.INFERENCE_SHUTDOWN_TIMEOUT_SECONDS
+        self.poll_interval = settings.INFERENCE_POLL_INTERVAL_SECONDS
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.purge_interval = settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS
+        self._next_purge_at = 0.0
+        # Renew beberapa kali per lease agar satu renew yang gagal (DB lambat) tidak fatal
+        self.heartbeat_interval = max(1.0, settings.INFERENCE_JOB_LEASE_SECONDS / 3)
+        self.reap_interval = max(1.0, float(settings.INFERENCE_JOB_LEASE_SECONDS))
+        self._next_reap_at = 0.0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._handler: Optional[JobHandler] = None
+        self._dead_handler: Optional[DeadJobHandler] = None
+        self._accepting = False
+        self._stopping = False
+        self._busy = 0
+
+        # Counters untuk monitoring
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dead = 0
+        self.shed = 0
+        self.deferred = 0
+        self.lease_lost = 0
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    async def start(self, handler: JobHandler, dead_handler: Optional[DeadJobHandler] = None):
+        """
+        Start worker pool (dipanggil di startup event)
+
+        handler: dijalankan per job, raise exception jika gagal (akan di-retry)
+        dead_handler: dijalankan saat job masuk dead-letter
+        """
+        if self._workers:
+            return
+
+        self._handler = handler
+        self._dead_handler = dead_handler
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker(f"{self.node_id}:{i}"), name=f"inference-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        self._accepting = True
+        print(f"✓ Inference scheduler started ({self.worker_count} workers, queue max {self.max_queue_size})")
+
+    async def submit(self, job_id: str) -> bool:
+        """
+        Beri tahu worker lokal bahwa ada job baru (job sudah tersimpan di database)
+
+        Jika queue lokal penuh:
+        - defer: tunggu slot kosong maksimal enqueue_timeout detik,
+          jika tetap penuh job dibiarkan pending untuk diambil polling
+        - shed: langsung tolak, caller menandai job sebagai dead
+
+        Returns: True jika hint diterima / job ditunda, False jika job harus di-shed
+        """
+        if not self._accepting or self._queue is None:
+            # Scheduler tidak jalan di proses ini - job tetap pending di database
+            return self.full_policy == "defer"
+
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            if self.full_policy != "defer":
+                self.shed += 1
+                return False
+            try:
+                await asyncio.wait_for(self._queue.put(job_id), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                # Tetap durable di database, worker akan mengambilnya lewat polling
+                return True
+
+        self.submitted += 1
+        return True
+
+    async def _next_hint(self, wait: bool) -> Optional[str]:
+        """Ambil job_id dari queue lokal; None jika timeout (→ claim job mana pun)"""
+        try:
+            if not wait:
+                job_id = self._queue.get_nowait()
+            else:
+                job_id = await asyncio.wait_for(self._queue.get(), timeout=self.poll_interval)
+        except (asyncio.QueueEmpty, asyncio.TimeoutError):
+            return None
+        self._queue.task_done()
+        return job_id
+
+    async def _worker(self, worker_id: str):
+        """Loop worker: tunggu hint atau poll interval, claim job, jalankan handler"""
+        found_work = False
+        while not self._stopping:
+            try:
+                job_id = await self._next_hint(wait=not found_work)
+                found_work = await self._process_one(worker_id, job_id)
+                if job_id and not found_work:
+                    # Hint sudah diambil proses lain, coba job lain yang siap
+                    found_work = await self._process_one(worker_id, None)
+                if not found_work:
+                    await self._run_maintenance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                found_work = False
+                print(f"✗ Inference worker {worker_id} error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run_maintenance(self):
+        """Housekeeping saat idle (satu worker per tugas, maksimal sekali per interval)"""
+        now = time.monotonic()
+        if now >= self._next_reap_at:
+            # Set sebelum await agar worker lain tidak ikut menjalankan
+            self._next_reap_at = now + self.reap_interval
+            await self._reap_expired_jobs()
+        if now >= self._next_purge_at:
+            self._next_purge_at = now + self.purge_interval
+            await self._purge_idempotency_keys()
+
+    async def _reap_expired_jobs(self):
+        """Dead-letter job yang worker-nya mati di attempt terakhir"""
+        try:
+            async with AsyncSessionLocal() as db:
+                reaped = await job_queue.reap_expired(db)
+        except Exception as e:
+            print(f"✗ Inference job reaper error: {str(e)}")
+            return
+        for job in reaped:
+            self.dead += 1
+            print(f"✗ Inference job dead-lettered for {job.device_code}: {job.last_error}")
+            if self._dead_handler:
+                await self._dead_handler(job, job.last_error)
+
+    async def _purge_idempotency_keys(self):
+        """Purge idempotency key kadaluarsa"""
+        try:
+            async with AsyncSessionLocal() as db:
+                purged = await idempotency_service.purge_expired(db)
+            if purged:
+                print(f"🧹 Purged {purged} expired idempotency keys")
+        except Exception as e:
+            print(f"✗ Idempotency purge error: {str(e)}")
+
+    async def _run_with_lease(self, job: InferenceJob):
+        """
+        Jalankan handler sambil memperpanjang lease job setiap heartbeat_interval
+        Raises: LeaseLostError (handler dibatalkan) jika job sudah tidak dipegang worker ini
+        """
+        handler_task = asyncio.create_task(self._handler(job))
+        try:
+            while True:
+                done, _ = await asyncio.wait({handler_task}, timeout=self.heartbeat_interval)
+                if done:
+                    return handler_task.result()
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await job_queue.renew_lease(db, job)
+                except LeaseLostError:
+                    raise
+                except Exception as e:
+                    # Lease lama masih berlaku; coba lagi di heartbeat berikutnya
+                    print(f"⚠️  Inference job lease renewal failed for {job.device_code}: {str(e)}")
+        finally:
+            if not handler_task.done():
+                # Lease hilang atau worker di-cancel (shutdown)
+                handler_task.cancel()
+                await asyncio.gather(handler_task, return_exceptions=True)
+
+    async def _process_one(self, worker_id: str, job_id: Optional[str]) -> bool:
+        """Claim dan kerjakan satu job. Returns True jika ada job yang dikerjakan"""
+        # Session claim ditutup sebelum handler: tidak ada koneksi DB / transaksi
+        # yang tertahan selama preprocessing & request provider
+        async with AsyncSessionLocal() as db:
+            job = await job_queue.claim(db, worker_id, job_id)
+        if not job:
+            return False
+
+        self._busy += 1
+        try:
+            try:
+                await self._run_with_lease(job)
+            except LeaseLostError:
+                raise
+            except CircuitOpenError as e:
+                self.deferred += 1
+                async with AsyncSessionLocal() as db:
+                    await job_queue.release(db, job, e.retry_after, str(e))
+                print(f"⏸  Inference job deferred for {job.device_code}: {str(e)}")
+            except Exception as e:
+                self.failed += 1
+                async with AsyncSessionLocal() as db:
+                    is_dead = await job_queue.fail(db, job, str(e))
+                if is_dead:
+                    self.dead += 1
+                    print(f"✗ Inference job dead-lettered for {job.device_code} after {job.attempts} attempts: {str(e)}")
+                    if self._dead_handler:
+                        await self._dead_handler(job, str(e))
+                else:
+                    print(f"⚠️  Inference job retry scheduled for {job.device_code} (attempt {job.attempts}): {str(e)}")
+            else:
+                async with AsyncSessionLocal() as db:
+                    await job_queue.complete(db, job)
+                self.completed += 1
+        except LeaseLostError as e:
+            # Worker lain sudah memegang job ini: status job bukan urusan worker ini lagi
+            self.lease_lost += 1
+            print(f"⚠️  Inference job lease lost for {job.device_code}: {str(e)}")
+        finally:
+            self._busy -= 1
+        return True
+
+    async def stop(self):
+        """
+        Graceful shutdown:
+        1. Stop menerima hint baru
+        2. Tunggu job yang sedang berjalan selesai (maksimal shutdown_timeout)
+        3. Cancel worker (job yang terputus di-claim ulang setelah lease habis)
+        """
+        if not self._workers:
+            return
+
+        self._accepting = False
+        self._stopping = True
+        if self._busy:
+            print(f"⏳ Draining {self._busy} running inference jobs...")
+
+        done, pending = await asyncio.wait(self._workers, timeout=self.shutdown_timeout)
+        if pending:
+            print(f"⚠️  Inference drain timeout, {len(pending)} workers cancelled")
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        print("✓ Inference scheduler stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "node_id": self.node_id,
+            "workers": len(self._workers),
+            "busy_workers": self._busy,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_max_size": self.max_queue_size,
+            "full_policy": self.full_policy,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dead": self.dead,
+            "shed": self.shed,
+            "deferred": self.deferred,
+            "lease_lost": self.lease_lost,
+        }
+
+
+inference_scheduler = InferenceScheduler()
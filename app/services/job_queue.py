@@ -0,0 +1,241 @@
+"""
+Inference Job Queue - durable queue di tabel inference_jobs
+
+Design Philosophy:
+- Job ditulis dalam transaksi yang sama dengan Image (tidak ada frame tanpa job)
+- Claim dengan SELECT ... FOR UPDATE SKIP LOCKED → aman untuk banyak proses/pod
+- Lease: worker memperpanjang lease selama handler berjalan (renew_lease); job running
+  yang lease-nya habis (worker mati) di-claim ulang selama attempts < max_attempts,
+  setelah itu di-dead-letter oleh reap_expired
+- Setiap update setelah claim memakai compare-and-set pada locked_by + attempts:
+  worker yang lease-nya sudah diambil alih worker lain tidak bisa menimpa status job
+- Retry dengan exponential backoff, lalu dead-letter setelah max_attempts
+- Release: job dikembalikan tanpa menghitung attempt (provider sedang tidak tersedia)
+"""
+
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings, get_current_time
+from app.models.inference_job import InferenceJob
+
+
+class LeaseLostError(Exception):
+    """Job sudah tidak dipegang worker ini (lease habis dan di-claim ulang / di-dead-letter)"""
+    pass
+
+
+class InferenceJobQueue:
+    """Operasi queue untuk tabel inference_jobs"""
+
+    def __init__(self):
+        self.lease_seconds = settings.INFERENCE_JOB_LEASE_SECONDS
+        self.max_attempts = settings.INFERENCE_JOB_MAX_ATTEMPTS
+        self.retry_base_seconds = settings.INFERENCE_JOB_RETRY_BASE_SECONDS
+        self.retry_max_seconds = settings.INFERENCE_JOB_RETRY_MAX_SECONDS
+
+    def enqueue(
+        self,
+        db: AsyncSession,
+        image_id: str,
+        device_id: str,
+        device_code: str,
+        preprocessed_image_path: Optional[str] = None
+    ) -> InferenceJob:
+        """
+        Tambah job ke session (tanpa commit)
+        Caller commit bersama baris Image dalam satu transaksi
+        """
+        job = InferenceJob(
+            image_id=image_id,
+            device_id=device_id,
+            device_code=device_code,
+            preprocessed_image_path=preprocessed_image_path,
+            status="pending",
+            attempts=0,
+            max_attempts=self.max_attempts,
+            available_at=get_current_time()
+        )
+        db.add(job)
+        return job
+
+    async def claim(
+        self,
+        db: AsyncSession,
+        worker_id: str,
+        job_id: Optional[str] = None
+    ) -> Optional[InferenceJob]:
+        """
+        Claim satu job yang siap dikerjakan
+
+        Job siap = pending dan available_at sudah lewat,
+        atau running tetapi lease sudah expired (worker sebelumnya mati) dan attempts
+        belum habis; job expired yang attempts-nya habis di-dead-letter oleh reap_expired.
+        job_id: claim job tertentu (hint dari proses ini), None = job mana pun
+
+        Returns: InferenceJob (status running, detached dari session) atau None jika tidak ada
+        """
+        now = get_current_time()
+        claimable = or_(
+            and_(InferenceJob.status == "pending", InferenceJob.available_at <= now),
+            and_(
+                InferenceJob.status == "running",
+                InferenceJob.lease_expires_at < now,
+                InferenceJob.attempts < InferenceJob.max_attempts
+            )
+        )
+        stmt = select(InferenceJob.id).where(claimable)
+        if job_id:
+            stmt = stmt.where(InferenceJob.id == job_id)
+
+        stmt = stmt.order_by(InferenceJob.available_at).limit(1).with_for_update(skip_locked=True)
+
+        candidate_id = (await db.execute(stmt)).scalar()
+        if not candidate_id:
+            await db.rollback()
+            return None
+
+        # Compare-and-set: hanya berhasil jika job masih claimable
+        # (pengaman untuk database tanpa SKIP LOCKED, misal sqlite lokal)
+        result = await db.execute(
+            update(InferenceJob).where(
+                InferenceJob.id == candidate_id,
+                claimable
+            ).values(
+                status="running",
+                attempts=InferenceJob.attempts + 1,
+                locked_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            return None
+
+        job = await db.get(InferenceJob, candidate_id, populate_existing=True)
+        # Lepas dari session & akhiri transaksi baca: koneksi kembali ke pool
+        # dan tidak ada snapshot yang terbuka selama handler berjalan
+        db.expunge(job)
+        await db.commit()
+        return job
+
+    def _held_by(self, job: InferenceJob):
+        """Kondisi WHERE: job masih dipegang claim ini (worker & attempt yang sama)"""
+        return and_(
+            InferenceJob.id == job.id,
+            InferenceJob.status == "running",
+            InferenceJob.locked_by == job.locked_by,
+            InferenceJob.attempts == job.attempts
+        )
+
+    async def _save(self, db: AsyncSession, job: InferenceJob, *conditions, **values):
+        """
+        Update kolom job (object detached dari claim) dan commit
+        conditions: syarat WHERE tambahan selain job masih dipegang claim ini
+        Raises: LeaseLostError jika job sudah tidak dipegang claim ini
+        """
+        result = await db.execute(
+            update(InferenceJob).where(self._held_by(job), *conditions).values(
+                updated_at=get_current_time(), **values
+            ).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            raise LeaseLostError(f"Inference job {job.id} is no longer held by {job.locked_by}")
+        for key, value in values.items():
+            setattr(job, key, value)
+
+    async def renew_lease(self, db: AsyncSession, job: InferenceJob):
+        """
+        Perpanjang lease job yang sedang dikerjakan (heartbeat worker)
+        Raises: LeaseLostError jika job sudah tidak dipegang claim ini
+        """
+        await self._save(
+            db, job,
+            lease_expires_at=get_current_time() + timedelta(seconds=self.lease_seconds)
+        )
+
+    async def reap_expired(self, db: AsyncSession) -> List[InferenceJob]:
+        """
+        Dead-letter job running yang lease-nya habis dan attempts-nya sudah habis
+        (worker mati di attempt terakhir) - job seperti ini tidak pernah di-claim ulang
+
+        Returns: job yang masuk dead-letter (detached dari session)
+        """
+        now = get_current_time()
+        result = await db.execute(
+            select(InferenceJob).where(
+                InferenceJob.status == "running",
+                InferenceJob.lease_expires_at < now,
+                InferenceJob.attempts >= InferenceJob.max_attempts
+            ).order_by(InferenceJob.lease_expires_at)
+        )
+        candidates = result.scalars().all()
+        for job in candidates:
+            db.expunge(job)
+        await db.commit()
+
+        reaped = []
+        for job in candidates:
+            try:
+                await self._save(
+                    db, job,
+                    InferenceJob.lease_expires_at < now,
+                    status="dead",
+                    lease_expires_at=None,
+                    last_error="Lease expired on last attempt"
+                )
+            except LeaseLostError:
+                # Sudah di-reap proses lain, atau worker lama sempat renew / menyelesaikan job
+                continue
+            reaped.append(job)
+        return reaped
+
+    async def complete(self, db: AsyncSession, job: InferenceJob):
+        """Tandai job selesai"""
+        await self._save(db, job, status="done", lease_expires_at=None, last_error=None)
+
+    async def fail(self, db: AsyncSession, job: InferenceJob, error: str) -> bool:
+        """
+        Catat kegagalan job
+        Retry dengan exponential backoff, dead-letter jika attempts habis
+
+        Returns: True jika job masuk dead-letter
+        """
+        if job.attempts >= job.max_attempts:
+            await self._save(db, job, status="dead", lease_expires_at=None, last_error=error)
+            return True
+
+        delay = min(
+            self.retry_base_seconds * (2 ** (job.attempts - 1)),
+            self.retry_max_seconds
+        )
+        await self._save(
+            db, job,
+            status="pending",
+            lease_expires_at=None,
+            last_error=error,
+            available_at=get_current_time() + timedelta(seconds=delay)
+        )
+        return False
+
+    async def release(self, db: AsyncSession, job: InferenceJob, delay_seconds: float, reason: str):
+        """
+        Kembalikan job ke pending tanpa menghabiskan attempt
+        Dipakai saat job tidak dikerjakan sama sekali (misal circuit breaker provider open)
+        """
+        await self._save(
+            db, job,
+            status="pending",
+            attempts=max(0, job.attempts - 1),
+            lease_expires_at=None,
+            last_error=reason,
+            available_at=get_current_time() + timedelta(seconds=delay_seconds)
+        )
+
+
+job_queue = InferenceJobQueue()
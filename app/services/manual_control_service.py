@@ -8,7 +8,9 @@ Design Philosophy:
 - Message and timestamp for transparency
 """
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Dict, Any
 
 from app.models.manual_control import DeviceControl, generate_uuid
@@ -143,7 +145,23 @@ class DeviceControlService:
             Control response with mode, command/action, status, message, timestamp
         """
         control = DeviceControlService.get_control(db, device_code)
+        return DeviceControlService.build_control_response(control, automatic_action)
+
+    @staticmethod
+    def build_control_response(
+        control: Optional[DeviceControl],
+        automatic_action: str
+    ) -> Dict[str, Any]:
+        """
+        Build polling response from control row (no database access)
         
+        Args:
+            control: Current DeviceControl or None
+            automatic_action: Action from inference
+            
+        Returns:
+            Control response dict
+        """
         # If control exists and status is PENDING, return manual control
         if control and control.status == "PENDING":
             return {
@@ -183,3 +201,157 @@ class DeviceControlService:
             return True
         
         return False
+
+
+class AsyncDeviceControlService:
+    """
+    Async version of DeviceControlService for AsyncSession
+    
+    Same semantics as DeviceControlService, used by the API endpoints
+    so database I/O does not block the event loop.
+    """
+
+    @staticmethod
+    async def get_control(db: AsyncSession, device_code: str) -> Optional[DeviceControl]:
+        """
+        Get current control status for device
+        
+        Args:
+            db: Async database session
+            device_code: Device identifier
+            
+        Returns:
+            DeviceControl object if exists, None otherwise
+        """
+        result = await db.execute(
+            select(DeviceControl).where(DeviceControl.device_code == device_code)
+        )
+        return result.scalars().first()
+
+    @staticmethod
+    async def set_control(
+        db: AsyncSession,
+        device_code: str,
+        control_command: str,
+        message: Optional[str] = None
+    ) -> DeviceControl:
+        """
+        Set control command for device (upsert)
+        
+        Args:
+            db: Async database session
+            device_code: Device identifier
+            control_command: Command (ACTIVATE, SLEEP, ACTIVATE_SERVO, STOP_SERVO)
+            message: Optional message
+            
+        Returns:
+            DeviceControl object
+            
+        Raises:
+            ValueError: If device not found
+        """
+        result = await db.execute(
+            select(Device.id).where(Device.device_code == device_code)
+        )
+        device_id = result.scalar()
+        if not device_id:
+            raise ValueError(f"Device {device_code} not found")
+
+        control = await AsyncDeviceControlService.get_control(db, device_code)
+        
+        if control:
+            control.control_command = control_command
+            control.status = "PENDING"
+            control.message = message or f"Control set to {control_command}"
+            control.updated_at = get_current_time()
+        else:
+            control = DeviceControl(
+                id=generate_uuid(),
+                device_id=device_id,
+                device_code=device_code,
+                control_command=control_command,
+                status="PENDING",
+                message=message or f"Control initialized to {control_command}",
+                created_at=get_current_time(),
+                updated_at=get_current_time()
+            )
+            db.add(control)
+        
+        await db.commit()
+        await db.refresh(control)
+        return control
+
+    @staticmethod
+    async def update_status(
+        db: AsyncSession,
+        device_code: str,
+        status: str,
+        message: Optional[str] = None
+    ) -> Optional[DeviceControl]:
+        """
+        Update control status (called by IoT after execution)
+        
+        Args:
+            db: Async database session
+            device_code: Device identifier
+            status: New status (EXECUTED, FAILED)
+            message: Optional message from IoT
+            
+        Returns:
+            Updated DeviceControl object, or None if not found
+        """
+        control = await AsyncDeviceControlService.get_control(db, device_code)
+        
+        if not control:
+            return None
+        
+        control.status = status
+        control.message = message or f"Status updated to {status}"
+        control.updated_at = get_current_time()
+        
+        await db.commit()
+        await db.refresh(control)
+        return control
+
+    @staticmethod
+    async def get_control_response(
+        db: AsyncSession,
+        device_code: str,
+        automatic_action: str
+    ) -> Dict[str, Any]:
+        """
+        Get control response for IoT polling
+        
+        Priority: Manual control overrides automatic if status=PENDING
+        
+        Args:
+            db: Async database session
+            device_code: Device identifier
+            automatic_action: Action from inference (ACTIVATE/SLEEP)
+            
+        Returns:
+            Control response with mode, command/action, status, message, timestamp
+        """
+        control = await AsyncDeviceControlService.get_control(db, device_code)
+        return DeviceControlService.build_control_response(control, automatic_action)
+
+    @staticmethod
+    async def reset_control(db: AsyncSession, device_code: str) -> bool:
+        """
+        Reset control to default state
+        
+        Args:
+            db: Async database session
+            device_code: Device identifier
+            
+        Returns:
+            True if deleted, False if not found
+        """
+        control = await AsyncDeviceControlService.get_control(db, device_code)
+        
+        if control:
+            await db.delete(control)
+            await db.commit()
+            return True
+        
+        return False
@@ -0,0 +1,154 @@
+"""
+Notification Aggregator - digest notifikasi BAHAYA + rate limit
+
+Design Philosophy:
+- Saat wabah, puluhan device bisa BAHAYA hampir bersamaan; satu /notify per
+  keputusan menghabiskan kuota notifikasi Blynk dan mengirim ratusan request
+- Event BAHAYA dikumpulkan selama window, lalu dikirim sebagai satu digest
+  (daftar device + jumlah jentik)
+- Rate limit per device: device yang sudah dinotifikasi tidak disebut lagi
+  sampai interval minimal lewat (device flapping tidak spam)
+- Rate limit global: maksimal N notifikasi per jam; jika habis, digest ditunda
+  (event baru tetap digabung), bukan dibuang
+- State di memory per proses (notifikasi = best effort)
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.services.blynk_service import blynk_service
+
+
+class NotificationAggregator:
+    """Kumpulkan event BAHAYA dan kirim sebagai digest ke Blynk"""
+
+    # Batas device yang ditulis di body notifikasi, sisanya diringkas
+    MAX_LISTED_DEVICES = 10
+
+    def __init__(self):
+        self.window_seconds = settings.NOTIFICATION_DIGEST_WINDOW_SECONDS
+        self.device_min_interval = settings.NOTIFICATION_DEVICE_MIN_INTERVAL_SECONDS
+        self.global_max_per_hour = settings.NOTIFICATION_GLOBAL_MAX_PER_HOUR
+
+        # device_code → {"larva_count": terakhir, "events": jumlah event di window}
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._last_notified: Dict[str, float] = {}
+        self._sent_times = deque()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters untuk monitoring
+        self.events = 0
+        self.suppressed = 0
+        self.digests_sent = 0
+        self.digests_failed = 0
+        self.deferred = 0
+
+    def add(self, device_code: str, larva_count: int):
+        """Catat event BAHAYA; digest dikirim setelah window habis"""
+        if not blynk_service.auth_token:
+            return
+
+        self.events += 1
+        now = time.monotonic()
+        last = self._last_notified.get(device_code)
+        if device_code not in self._pending and last is not None and now - last < self.device_min_interval:
+            self.suppressed += 1
+            return
+
+        entry = self._pending.setdefault(device_code, {"larva_count": larva_count, "events": 0})
+        entry["larva_count"] = larva_count
+        entry["events"] += 1
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_after(self.window_seconds))
+
+    def _global_wait_seconds(self) -> float:
+        """Sisa waktu sampai kuota global tersedia lagi (0 = boleh kirim)"""
+        now = time.monotonic()
+        while self._sent_times and now - self._sent_times[0] >= 3600:
+            self._sent_times.popleft()
+        if self.global_max_per_hour <= 0 or len(self._sent_times) < self.global_max_per_hour:
+            return 0.0
+        return 3600 - (now - self._sent_times[0])
+
+    async def _flush_after(self, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            while self._pending:
+                wait = self._global_wait_seconds()
+                if wait > 0:
+                    self.deferred += 1
+                    print(f"⏸  Notification quota reached, digest deferred {wait:.0f}s ({len(self._pending)} devices)")
+                    await asyncio.sleep(wait)
+                    continue
+
+                await self.flush()
+                if self._pending:
+                    # Event masuk selama pengiriman (task masih aktif, add() tidak
+                    # menjadwalkan timer): kirim di window berikutnya
+                    await asyncio.sleep(self.window_seconds)
+        finally:
+            self._task = None
+
+    def build_message(self, pending: Dict[str, Dict[str, int]]) -> str:
+        if len(pending) == 1:
+            device_code, entry = next(iter(pending.items()))
+            return f"⚠️ PERINGATAN: Jentik terdeteksi di {device_code}! Jumlah: {entry['larva_count']}"
+
+        ordered = sorted(pending.items(), key=lambda item: item[1]["larva_count"], reverse=True)
+        listed = [
+            f"{device_code} ({entry['larva_count']})" + (f" x{entry['events']}" if entry["events"] > 1 else "")
+            for device_code, entry in ordered[:self.MAX_LISTED_DEVICES]
+        ]
+        more = len(ordered) - len(listed)
+        return (
+            f"⚠️ PERINGATAN: Jentik terdeteksi di {len(pending)} device: "
+            + ", ".join(listed)
+            + (f", +{more} lainnya" if more > 0 else "")
+        )
+
+    async def flush(self) -> bool:
+        """Kirim digest untuk semua event pending sekarang"""
+        if not self._pending:
+            return False
+
+        pending, self._pending = self._pending, {}
+        sent = await blynk_service.send_notification(self.build_message(pending))
+
+        now = time.monotonic()
+        if sent:
+            # Hanya pengiriman yang berhasil dihitung ke kuota per jam
+            self._sent_times.append(now)
+            self.digests_sent += 1
+            for device_code in pending:
+                self._last_notified[device_code] = now
+        else:
+            self.digests_failed += 1
+        return sent
+
+    async def stop(self):
+        """Kirim digest yang masih pending (jika kuota ada) saat shutdown"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._pending and self._global_wait_seconds() <= 0:
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window_seconds,
+            "pending_devices": len(self._pending),
+            "events": self.events,
+            "suppressed": self.suppressed,
+            "digests_sent": self.digests_sent,
+            "digests_failed": self.digests_failed,
+            "deferred": self.deferred,
+            "sent_last_hour": len(self._sent_times),
+            "global_max_per_hour": self.global_max_per_hour,
+        }
+
+
+notification_aggregator = NotificationAggregator()
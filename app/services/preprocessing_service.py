@@ -0,0 +1,99 @@
+"""
+Preprocessing Service - process pool untuk preprocessing image (CPU-heavy)
+
+Design Philosophy:
+- fastNlMeansDenoising + CLAHE + sharpening memakan ratusan ms CPU per frame,
+  jadi dijalankan di ProcessPoolExecutor, bukan di event loop
+- Hanya bytes yang dikirim ke/dari worker (bukan path file)
+- Thread OpenCV per worker dibatasi agar tidak oversubscription
+  (jumlah worker x thread OpenCV <= jumlah core)
+- Worker mati (OOM killer, crash OpenCV) membuat seluruh pool broken: pool dibuat ulang
+  dan task di-retry sekali, request berikutnya tidak ikut gagal
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Tuple
+
+from app.config import settings
+from app.utils.image_utils import perceptual_hash_image_data, preprocess_image_data
+
+
+def _init_worker(opencv_threads: int):
+    """Initializer setiap proses worker: batasi thread OpenCV"""
+    import cv2
+    cv2.setNumThreads(opencv_threads)
+
+
+class PreprocessingPool:
+    """Wrapper ProcessPoolExecutor untuk preprocess_image_data"""
+
+    def __init__(self):
+        self.worker_count = settings.PREPROCESS_WORKERS
+        self.opencv_threads = settings.PREPROCESS_OPENCV_THREADS
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Start process pool (dipanggil di startup event). PREPROCESS_WORKERS=0 = tanpa pool"""
+        if self._executor or self.worker_count <= 0:
+            return
+
+        self._executor = self._create_executor()
+        print(f"✓ Preprocessing pool started ({self.worker_count} processes, {self.opencv_threads} OpenCV threads each)")
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: aman untuk proses yang sudah punya thread (uvicorn, OpenCV)
+        return ProcessPoolExecutor(
+            max_workers=self.worker_count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.opencv_threads,)
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Ganti pool yang broken (sekali saja walau banyak task gagal bersamaan)"""
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+        print("⚠️  Preprocessing pool broken (worker died), restarted")
+
+    async def _run(self, fn: Callable[[bytes], Any], image_data: bytes) -> Any:
+        """Jalankan fn di process pool; pool broken → buat ulang lalu retry sekali"""
+        if self._executor is None:
+            # Pool nonaktif - tetap jangan blokir event loop
+            return await asyncio.to_thread(fn, image_data)
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            return await loop.run_in_executor(executor, fn, image_data)
+        except BrokenProcessPool:
+            if self._executor is None:
+                # Pool sedang di-stop (shutdown)
+                raise
+            self._restart(executor)
+            return await loop.run_in_executor(self._executor, fn, image_data)
+
+    async def preprocess(self, image_data: bytes) -> Tuple[int, int, str, bytes]:
+        """
+        Preprocess image bytes di process pool
+        Returns: (width, height, checksum, image_data)
+        """
+        return await self._run(preprocess_image_data, image_data)
+
+    async def perceptual_hash(self, image_data: bytes) -> str:
+        """Perceptual hash (dHash) image bytes di process pool"""
+        return await self._run(perceptual_hash_image_data, image_data)
+
+    def stop(self):
+        """Shutdown process pool"""
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            print("✓ Preprocessing pool stopped")
+
+
+preprocessing_pool = PreprocessingPool()
@@ -0,0 +1,358 @@
+"""
+Resilience - adaptive concurrency limit (AIMD) + circuit breaker untuk provider eksternal
+
+Design Philosophy:
+- Saat provider lambat / 5xx, mengirim lebih banyak request hanya memperparah antrian
+- AIMD: limit naik perlahan (+1 per `limit` sukses cepat), turun drastis (x backoff)
+  saat latency melewati target atau terjadi error provider
+- Circuit breaker: setelah N kegagalan beruntun, request langsung ditolak
+  (CircuitOpenError) selama open_seconds, lalu satu request probe (half-open)
+  menentukan apakah circuit ditutup lagi
+- Error non-provider (misal 4xx karena image rusak) tidak dihitung sebagai kegagalan
+- Hedging: jika request pertama lebih lambat dari persentil latency terbaru,
+  kirim request kedua dan pakai yang selesai duluan (jumlah hedge dibatasi rasio)
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """Provider sedang tidak tersedia (circuit open) - coba lagi setelah retry_after detik"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrencyLimiter:
+    """Semaphore dengan limit yang menyesuaikan latency & error (AIMD)"""
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target_seconds: float,
+        backoff_factor: float = 0.5
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_target_seconds = latency_target_seconds
+        self.backoff_factor = backoff_factor
+        self.in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+        # Counters untuk monitoring
+        self.increases = 0
+        self.decreases = 0
+        self.waits = 0
+        self.last_latency: Optional[float] = None
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Dibuat lazy agar terikat ke event loop yang menjalankan request
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            if self.in_flight >= self.current_limit:
+                self.waits += 1
+            await condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def on_success(self, latency: float):
+        """Additive increase jika cepat, multiplicative decrease jika melewati target"""
+        self.last_latency = latency
+        if latency > self.latency_target_seconds:
+            self._decrease()
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+
+    def on_failure(self):
+        self._decrease()
+
+    def _decrease(self):
+        new_limit = max(self.min_limit, self.limit * self.backoff_factor)
+        if new_limit < self.limit:
+            self.limit = new_limit
+            self.decreases += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.current_limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "latency_target_seconds": self.latency_target_seconds,
+            "last_latency_seconds": round(self.last_latency, 3) if self.last_latency is not None else None,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "waits": self.waits,
+        }
+
+
+class CircuitBreaker:
+    """Circuit breaker closed → open → half_open → closed/open"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+        # Counters untuk monitoring
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        """Sisa waktu (detik) sampai circuit boleh dicoba lagi"""
+        if self.state == self.CLOSED or self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self):
+        """Raise CircuitOpenError jika request tidak boleh dikirim"""
+        if self.state == self.CLOSED:
+            return
+
+        if self.state == self.OPEN and self.retry_after() <= 0:
+            self.state = self.HALF_OPEN
+            print(f"🔌 {self.name} circuit half-open, sending probe request")
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            # Hanya satu probe; request lain tetap ditolak sampai hasilnya diketahui
+            self._probe_in_flight = True
+            return
+
+        self.rejected += 1
+        raise CircuitOpenError(self.name, self.retry_after() or self.open_seconds)
+
+    def on_success(self):
+        if self.state != self.CLOSED:
+            print(f"✓ {self.name} circuit closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def on_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def on_ignored(self):
+        """Request selesai tanpa menentukan kesehatan provider (error non-provider)"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _open(self):
+        if self.state != self.OPEN:
+            self.opened += 1
+            print(f"⚠️  {self.name} circuit open after {self.consecutive_failures} failures, pausing {self.open_seconds:.0f}s")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "open_seconds": self.open_seconds,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class ResilientCaller:
+    """
+    Gabungan circuit breaker + adaptive limiter untuk satu provider
+
+    is_failure: klasifikasi exception - True jika kesalahan provider
+    (timeout, koneksi, 5xx/429) yang harus menurunkan limit & dihitung breaker
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        limiter: AdaptiveConcurrencyLimiter,
+        is_failure: Callable[[BaseException], bool]
+    ):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.is_failure = is_failure
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.breaker.before_call()
+        await self.limiter.acquire()
+        started = time.monotonic()
+        try:
+            if self.breaker.state == CircuitBreaker.OPEN:
+                # Circuit terbuka selama request ini menunggu slot limiter
+                self.breaker.rejected += 1
+                raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+            result = await fn()
+        except CircuitOpenError:
+            raise
+        except asyncio.CancelledError:
+            # Dibatalkan (deadline / kalah hedge) - tetap sinyal lambat jika melewati target
+            if time.monotonic() - started > self.limiter.latency_target_seconds:
+                self.limiter.on_failure()
+            self.breaker.on_ignored()
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self.limiter.on_failure()
+                self.breaker.on_failure()
+            else:
+                self.breaker.on_ignored()
+            raise
+        else:
+            self.limiter.on_success(time.monotonic() - started)
+            self.breaker.on_success()
+            return result
+        finally:
+            await self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit_breaker": self.breaker.stats(),
+            "concurrency": self.limiter.stats(),
+        }
+
+
+class LatencyWindow:
+    """Latency request terbaru (rolling window) untuk menghitung persentil"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+class Hedger:
+    """
+    Hedged request: request kedua dikirim jika request pertama belum selesai
+    setelah persentil latency (misal p95), hasil tercepat dipakai, sisanya di-cancel
+
+    - Hedge baru aktif setelah min_samples latency terkumpul
+    - Delay minimal min_delay_seconds (tidak hedge request yang memang cepat)
+    - Rasio hedge terhadap total request dibatasi max_ratio agar biaya tidak naik banyak
+    """
+
+    def __init__(
+        self,
+        percentile: float,
+        min_delay_seconds: float,
+        min_samples: int,
+        max_ratio: float
+    ):
+        self.percentile = percentile
+        self.min_delay_seconds = min_delay_seconds
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.latencies = LatencyWindow()
+
+        # Counters untuk monitoring
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.percentile > 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay sebelum hedge, None jika hedge tidak boleh dikirim"""
+        if not self.enabled or len(self.latencies) < self.min_samples:
+            return None
+        if self.hedged >= self.requests * self.max_ratio:
+            return None
+        return max(self.min_delay_seconds, self.latencies.percentile(self.percentile))
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.requests += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        primary.add_done_callback(
+            lambda task: task.cancelled() or task.exception() or self.latencies.record(time.monotonic() - started)
+        )
+        if not self.enabled:
+            return await primary
+
+        tasks = {primary}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    tasks.add(asyncio.ensure_future(fn()))
+
+            first_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            if not primary.done():
+                                # Request pertama kalah: latency-nya minimal selama ini
+                                self.latencies.record(time.monotonic() - started)
+                        return task.result()
+                    if first_error is None or task is primary:
+                        first_error = task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        p = self.latencies.percentile(self.percentile) if self.enabled else None
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "percentile_latency_seconds": round(p, 3) if p is not None else None,
+            "samples": len(self.latencies),
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
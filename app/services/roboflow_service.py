@@ -1,17 +1,49 @@
+import asyncio
+import time
 import httpx
 from typing import Dict, Any, Optional
 from app.config import settings
+from app.services.inference_backends import HAS_INFERENCE_SDK, InferenceBackend, create_inference_backend
+from app.services.inference_cache import inference_cache
+from app.services.resilience import AdaptiveConcurrencyLimiter, CircuitBreaker, Hedger, ResilientCaller
+from app.utils.image_utils import file_checksum
 
-# Try to import inference_sdk, fallback to httpx
+# Error koneksi dari requests (dipakai inference_sdk)
 try:
-    from inference_sdk import InferenceHTTPClient
-    HAS_INFERENCE_SDK = True
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+    REQUESTS_TRANSPORT_ERRORS = (RequestsConnectionError, RequestsTimeout)
 except ImportError:
-    HAS_INFERENCE_SDK = False
+    REQUESTS_TRANSPORT_ERRORS = ()
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    True jika error berasal dari Roboflow yang sedang bermasalah
+    (timeout, koneksi gagal, HTTP 5xx / 429), bukan dari request kita (4xx, file rusak)
+    Error dibungkus ulang dengan Exception(...) di service ini, jadi chain
+    __cause__/__context__ ditelusuri sampai error aslinya
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status_code = getattr(error, "status_code", None)
+        response = getattr(error, "response", None)
+        if status_code is None and response is not None:
+            status_code = getattr(response, "status_code", None)
+        if isinstance(status_code, int):
+            return status_code >= 500 or status_code == 429
+        if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, TimeoutError) + REQUESTS_TRANSPORT_ERRORS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
 
 
 class RoboflowService:
-    """Service untuk komunikasi dengan Roboflow API"""
+    """
+    Service inference (nama lama dipertahankan): cache, deadline, hedging,
+    circuit breaker & parse_prediction di depan backend inference aktif
+    (Roboflow workflow/detection, model lokal, atau stub - lihat inference_backends)
+    """
     
     def __init__(self):
         self.api_key = settings.ROBOFLOW_API_KEY
@@ -23,150 +55,124 @@ class RoboflowService:
         
         # Debug logging
         print(f"🔧 Roboflow Service Init:")
-        print(f"   API Key: {'✓' if self.api_key else '✗'}")
-        print(f"   Workspace: {self.workspace or '✗'}")
-        print(f"   Workflow ID: {self.workflow_id or '✗'}")
-        print(f"   Model ID: {self.model_id or '✗'}")
-        print(f"   inference_sdk installed: {'✓' if HAS_INFERENCE_SDK else '✗'}")
+        print(f"   Backend: {settings.INFERENCE_BACKEND}")
+        if settings.INFERENCE_BACKEND == "roboflow":
+            print(f"   API Key: {'✓' if self.api_key else '✗'}")
+            print(f"   Workspace: {self.workspace or '✗'}")
+            print(f"   Workflow ID: {self.workflow_id or '✗'}")
+            print(f"   Model ID: {self.model_id or '✗'}")
+            print(f"   inference_sdk installed: {'✓' if HAS_INFERENCE_SDK else '✗'}")
         
-        # Initialize client for workflows
-        if self.workspace and self.workflow_id:
-            if HAS_INFERENCE_SDK:
-                self.client = InferenceHTTPClient(
-                    api_url="https://serverless.roboflow.com",
-                    api_key=self.api_key
-                )
-                print(f"   Mode: Workflow (inference_sdk) ✓")
-            else:
-                self.client = None
-                print(f"   Mode: Workflow (httpx) ✓")
-            self.api_type = "workflow"
-            self.base_url = "https://serverless.roboflow.com"
-        elif self.model_id:
-            self.client = None
-            self.api_type = "detection"
-            self.base_url = "https://detect.roboflow.com"
-            print(f"   Mode: Detection ✓")
-        else:
-            self.client = None
-            self.api_type = None
-            print(f"   Mode: ✗ NOT CONFIGURED")
-            print(f"   ⚠️  Need either (workspace + workflow_id) OR model_id")
+        self.backend: InferenceBackend = create_inference_backend()
+        
+        # Adaptive concurrency + circuit breaker untuk request keluar ke Roboflow
+        self.guard = ResilientCaller(
+            breaker=CircuitBreaker(
+                "Roboflow",
+                failure_threshold=settings.ROBOFLOW_BREAKER_FAILURE_THRESHOLD,
+                open_seconds=settings.ROBOFLOW_BREAKER_OPEN_SECONDS
+            ),
+            limiter=AdaptiveConcurrencyLimiter(
+                initial_limit=settings.ROBOFLOW_CONCURRENCY_INITIAL,
+                min_limit=settings.ROBOFLOW_CONCURRENCY_MIN,
+                max_limit=settings.ROBOFLOW_CONCURRENCY_MAX,
+                latency_target_seconds=settings.ROBOFLOW_LATENCY_TARGET_SECONDS,
+                backoff_factor=settings.ROBOFLOW_CONCURRENCY_BACKOFF
+            ),
+            is_failure=is_provider_failure
+        )
+        # Hedged request untuk memotong tail latency (percentile 0 = nonaktif)
+        # Hanya untuk backend remote yang bisa di-cancel (httpx): pada path SDK request
+        # yang kalah tetap berjalan di thread executor (tetap dibayar, memakan slot
+        # ROBOFLOW_SDK_WORKERS) sementara slot limiter sudah dilepas
+        hedge_percentile = settings.ROBOFLOW_HEDGE_PERCENTILE
+        if hedge_percentile > 0 and not (self.backend.remote and self.backend.cancellable):
+            print(f"   Hedging: ✗ (not supported by backend {self.backend.name})")
+            hedge_percentile = 0
+        self.hedger = Hedger(
+            percentile=hedge_percentile,
+            min_delay_seconds=settings.ROBOFLOW_HEDGE_MIN_DELAY_SECONDS,
+            min_samples=settings.ROBOFLOW_HEDGE_MIN_SAMPLES,
+            max_ratio=settings.ROBOFLOW_HEDGE_MAX_RATIO
+        )
+    
+    async def start(self):
+        """Siapkan backend: shared HTTP client / executor / process pool (startup event)"""
+        await self.backend.start()
     
-    async def infer(self, image_path: str) -> Any:
+    async def stop(self):
+        """Tutup resource backend (dipanggil di shutdown event, setelah scheduler drain)"""
+        await self.backend.stop()
+    
+    @property
+    def model_key(self) -> str:
+        """Identitas model/workflow aktif (bagian dari key cache inference)"""
+        return self.backend.model_key
+    
+    async def infer(
+        self,
+        image_path: str,
+        checksum: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> Any:
         """
-        Kirim image ke Roboflow untuk inference
+        Kirim image ke backend inference, lewat inference_cache
+        Image yang sama (checksum SHA-256) untuk model yang sama tidak dikirim ulang;
+        request paralel untuk image yang sama digabung jadi satu
+        
+        Request keluar lewat self.guard (adaptive concurrency + circuit breaker);
+        raise CircuitOpenError tanpa menghubungi Roboflow selama circuit open
+        
+        checksum: SHA-256 image jika sudah diketahui (None = dihitung dari file)
+        deadline: batas waktu absolut job (time.monotonic()), None = hanya timeout HTTP;
+                  raise TimeoutError jika terlewati
         Returns: Raw prediction result dari Roboflow (bisa list atau dict)
         """
-        if not self.api_key:
-            raise Exception("Roboflow API key not configured")
+        compute = lambda: self._infer_within_deadline(image_path, deadline)
+        if not inference_cache.enabled:
+            return await compute()
         
-        print(f"📸 Starting inference for: {image_path}")
-        print(f"   API Type: {self.api_type}")
+        if not checksum:
+            checksum = await asyncio.to_thread(file_checksum, image_path)
         
-        if self.api_type == "workflow":
-            return await self._infer_workflow(image_path)
-        elif self.api_type == "detection":
-            return await self._infer_detection(image_path)
-        else:
-            error_msg = (
-                "Roboflow not properly configured. "
-                f"API Key: {'✓' if self.api_key else '✗'}, "
-                f"Workspace: {self.workspace or '✗'}, "
-                f"Workflow ID: {self.workflow_id or '✗'}, "
-                f"Model ID: {self.model_id or '✗'}, "
-                f"inference_sdk: {'✓' if HAS_INFERENCE_SDK else '✗ (run: pip install inference-sdk)'}"
-            )
-            raise Exception(error_msg)
+        # Pemanggil yang menunggu request paralel tetap dibatasi sisa budget job-nya
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise TimeoutError("Inference deadline exceeded before request was sent")
+        return await inference_cache.get_or_compute(f"{self.model_key}:{checksum}", compute, timeout=timeout)
     
-    async def _infer_workflow(self, image_path: str) -> Any:
-        """Inference menggunakan Roboflow Workflows (returns list atau dict)"""
-        if not self.workspace or not self.workflow_id:
-            raise Exception("Roboflow workspace or workflow_id not configured")
+    async def _infer_within_deadline(self, image_path: str, deadline: Optional[float]) -> Any:
+        """
+        Request (hedged) ke backend, dibatasi sisa budget deadline job
+        Deadline di dalam compute cache: request yang digabung menerima TimeoutError,
+        bukan CancelledError
         
-        # Try with inference_sdk first if available
-        if HAS_INFERENCE_SDK and self.client:
-            return await self._infer_workflow_sdk(image_path)
-        else:
-            return await self._infer_workflow_httpx(image_path)
-    
-    async def _infer_workflow_sdk(self, image_path: str) -> Any:
-        """Inference using inference_sdk (returns list atau dict)"""
-        if not self.client:
-            raise Exception("Workflow client not initialized")
+        Batasan backend tidak cancellable (inference_sdk di thread executor): saat deadline
+        lewat job gagal tepat waktu, tetapi call SDK tetap selesai di thread-nya dan slot
+        limiter concurrency sudah dilepas, jadi limiter bisa under-count beban sebenarnya
+        (dibatasi ROBOFLOW_SDK_WORKERS)
+        """
+        def call():
+            return self.hedger.call(lambda: self.guard.call(lambda: self._infer_uncached(image_path)))
         
-        try:
-            print(f"   🔄 Running workflow (SDK): {self.workspace}/{self.workflow_id}")
-            import asyncio
-            result = await asyncio.to_thread(
-                self.client.run_workflow,
-                workspace_name=self.workspace,
-                workflow_id=self.workflow_id,
-                images={"image": image_path},
-                use_cache=False
-            )
-            print(f"   ✓ Workflow completed successfully")
-            
-            # Return full result (list atau dict) tanpa parsing
-            # Biar raw_prediction tersimpan lengkap di database
-            return result
-                
-        except Exception as e:
-            print(f"   ✗ Workflow error: {str(e)}")
-            raise Exception(f"Roboflow Workflow error: {str(e)}")
-    
-    async def _infer_workflow_httpx(self, image_path: str) -> Any:
-        """Inference using httpx directly (returns list atau dict)"""
-        url = f"{self.base_url}/{self.workspace}/{self.workflow_id}"
+        if deadline is None:
+            return await call()
         
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Inference deadline exceeded before request was sent")
         try:
-            print(f"   🔄 Running workflow (httpx): {self.workspace}/{self.workflow_id}")
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                with open(image_path, 'rb') as image_file:
-                    files = {
-                        'image': ('image.jpg', image_file, 'image/jpeg')
-                    }
-                    params = {
-                        'api_key': self.api_key
-                    }
-                    response = await client.post(url, files=files, params=params)
-                    response.raise_for_status()
-                    result = response.json()
-                    
-            print(f"   ✓ Workflow completed successfully")
-            return result
-            
-        except httpx.HTTPError as e:
-            print(f"   ✗ Workflow HTTP error: {str(e)}")
-            raise Exception(f"Roboflow Workflow API error: {str(e)}")
-        except Exception as e:
-            print(f"   ✗ Workflow error: {str(e)}")
-            raise Exception(f"Workflow inference error: {str(e)}")
+            return await asyncio.wait_for(call(), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Inference deadline exceeded (budget {remaining:.1f}s)")
     
-    async def _infer_detection(self, image_path: str) -> Dict[str, Any]:
-        """Inference menggunakan Roboflow Detection API (legacy)"""
-        if not self.model_id:
-            raise Exception("Roboflow model ID not configured")
-        
-        url = f"{self.base_url}/{self.model_id}/{self.version}"
-        
-        params = {
-            "api_key": self.api_key,
-            "confidence": 40,
-            "overlap": 30
-        }
-        
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                with open(image_path, 'rb') as image_file:
-                    files = {'file': image_file}
-                    response = await client.post(url, params=params, files=files)
-                    response.raise_for_status()
-                    return response.json()
-        except httpx.HTTPError as e:
-            raise Exception(f"Roboflow API error: {str(e)}")
-        except Exception as e:
-            raise Exception(f"Inference error: {str(e)}")
+    async def _infer_uncached(self, image_path: str) -> Any:
+        """Inference langsung ke backend (tanpa cache)"""
+        print(f"📸 Starting inference for: {image_path}")
+        print(f"   Backend: {self.backend.name}")
+        return await self.backend.infer(image_path)
     
     def parse_prediction(self, raw_prediction: Any) -> Dict[str, Any]:
         """
@@ -0,0 +1,338 @@
+"""
+Storage Service - abstraksi penyimpanan file image
+
+Design Philosophy:
+- Kolom images.image_path menyimpan "location": path lokal atau URI s3://bucket/key
+  sehingga baris lama (path lokal) tetap bisa dibaca walaupun backend diganti
+- Local backend: filesystem dengan sharding directory (hash nama file)
+  agar satu directory tidak berisi jutaan file
+- S3 backend: S3-compatible (AWS S3, MinIO, dll) via boto3, endpoint bisa diatur
+- Upload tetap di-stream: ditulis ke file staging lokal (hash + batas ukuran),
+  lalu dipindah ke backend (S3: multipart upload boto3)
+- Content-addressed: nama file = SHA-256 isi file, sehingga frame identik
+  (retry ESP32, scene statis) hanya disimpan sekali
+- Bytes image tidak wajib masuk database (lihat STORE_IMAGE_BLOBS)
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Optional, Tuple
+
+from app.config import settings
+from app.utils.image_utils import (
+    ensure_directory_exists,
+    read_file,
+    remove_file_async,
+    save_image_stream,
+    write_file
+)
+
+# boto3 opsional - hanya dibutuhkan untuk STORAGE_BACKEND=s3
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    HAS_BOTO3 = True
+except ImportError:
+    HAS_BOTO3 = False
+
+
+S3_SCHEME = "s3://"
+
+
+def _replace_atomic(write, location: str):
+    """
+    Tulis ke file .part (unik per penulis) lalu os.replace ke location:
+    reader tidak pernah melihat file setengah jadi, penulis paralel isi sama aman
+    """
+    ensure_directory_exists(os.path.dirname(location))
+    temp_path = f"{location}.{uuid.uuid4().hex}.part"
+    try:
+        write(temp_path)
+        os.replace(temp_path, location)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+
+
+def shard_path(filename: str, depth: int) -> str:
+    """
+    Sub-directory shard dari hash nama file
+    depth=2: "ab/cd" (65536 directory), depth=0: tanpa shard
+    """
+    digest = hashlib.md5(filename.encode()).hexdigest()
+    return "/".join(digest[i * 2:i * 2 + 2] for i in range(depth))
+
+
+class StorageBackend:
+    """Interface backend storage (semua method async, I/O di thread)"""
+
+    name = "base"
+
+    def location_for(self, image_type: str, filename: str) -> str:
+        raise NotImplementedError
+
+    async def put_file(self, local_path: str, location: str):
+        """Pindahkan file lokal (staging) ke location"""
+        raise NotImplementedError
+
+    async def save(self, location: str, data: bytes):
+        raise NotImplementedError
+
+    async def exists(self, location: str) -> bool:
+        raise NotImplementedError
+
+    async def load(self, location: str) -> bytes:
+        raise NotImplementedError
+
+    async def delete(self, location: str):
+        raise NotImplementedError
+
+    def local_path(self, location: str):
+        """async context manager → path file lokal untuk library yang butuh path (misal inference_sdk)"""
+        raise NotImplementedError
+
+
+class LocalStorageBackend(StorageBackend):
+    """Filesystem lokal dengan sharding directory"""
+
+    name = "local"
+
+    def __init__(self, shard_depth: int = 2):
+        self.shard_depth = shard_depth
+        self.roots = {
+            "original": settings.IMAGE_ORIGINAL_PATH,
+            "preprocessed": settings.IMAGE_PREPROCESSED_PATH,
+        }
+
+    def location_for(self, image_type: str, filename: str) -> str:
+        root = self.roots.get(image_type, os.path.join(settings.STORAGE_PATH, image_type))
+        shard = shard_path(filename, self.shard_depth)
+        return os.path.join(root, shard, filename) if shard else os.path.join(root, filename)
+
+    async def put_file(self, local_path: str, location: str):
+        # shutil.move antar filesystem = copy, jadi tetap lewat .part
+        await asyncio.to_thread(
+            _replace_atomic,
+            lambda temp_path: shutil.move(local_path, temp_path),
+            location
+        )
+
+    async def save(self, location: str, data: bytes):
+        await asyncio.to_thread(
+            _replace_atomic,
+            lambda temp_path: write_file(temp_path, data),
+            location
+        )
+
+    async def exists(self, location: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, location)
+
+    async def load(self, location: str) -> bytes:
+        return await asyncio.to_thread(read_file, location)
+
+    async def delete(self, location: str):
+        await remove_file_async(location)
+
+    @asynccontextmanager
+    async def local_path(self, location: str):
+        yield location
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3-compatible object storage
+    S3_ENDPOINT_URL diisi untuk MinIO / storage lokal yang kompatibel S3
+    """
+
+    name = "s3"
+
+    def __init__(self, shard_depth: int = 2):
+        if not HAS_BOTO3:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (run: pip install boto3)")
+        if not settings.S3_BUCKET:
+            raise RuntimeError("S3_BUCKET not configured")
+
+        self.shard_depth = shard_depth
+        self.bucket = settings.S3_BUCKET
+        self.prefix = settings.S3_PREFIX.strip("/")
+        # boto3 client thread-safe, dipakai dari asyncio.to_thread
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY
+        )
+
+    def location_for(self, image_type: str, filename: str) -> str:
+        parts = [self.prefix, image_type, shard_path(filename, self.shard_depth), filename]
+        key = "/".join(part for part in parts if part)
+        return f"{S3_SCHEME}{self.bucket}/{key}"
+
+    @staticmethod
+    def split_location(location: str) -> Tuple[str, str]:
+        """s3://bucket/key -> (bucket, key)"""
+        bucket, _, key = location[len(S3_SCHEME):].partition("/")
+        return bucket, key
+
+    async def put_file(self, local_path: str, location: str):
+        bucket, key = self.split_location(location)
+        await asyncio.to_thread(
+            self.client.upload_file,
+            local_path,
+            bucket,
+            key,
+            ExtraArgs={"ContentType": "image/jpeg"}
+        )
+        await remove_file_async(local_path)
+
+    async def save(self, location: str, data: bytes):
+        bucket, key = self.split_location(location)
+        await asyncio.to_thread(
+            self.client.put_object,
+            Bucket=bucket,
+            Key=key,
+            Body=data,
+            ContentType="image/jpeg"
+        )
+
+    async def exists(self, location: str) -> bool:
+        bucket, key = self.split_location(location)
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def load(self, location: str) -> bytes:
+        bucket, key = self.split_location(location)
+        response = await asyncio.to_thread(self.client.get_object, Bucket=bucket, Key=key)
+        return await asyncio.to_thread(response["Body"].read)
+
+    async def delete(self, location: str):
+        bucket, key = self.split_location(location)
+        await asyncio.to_thread(self.client.delete_object, Bucket=bucket, Key=key)
+
+    @asynccontextmanager
+    async def local_path(self, location: str):
+        fd, temp_path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        try:
+            bucket, key = self.split_location(location)
+            await asyncio.to_thread(self.client.download_file, bucket, key, temp_path)
+            yield temp_path
+        finally:
+            await remove_file_async(temp_path)
+
+
+class StorageService:
+    """
+    Facade storage yang dipakai endpoint & pipeline inference
+    File baru ditulis ke backend aktif; file lama dibaca sesuai bentuk location-nya
+    """
+
+    def __init__(self):
+        self.backend_name = settings.STORAGE_BACKEND
+        self.shard_depth = max(0, settings.STORAGE_SHARD_DEPTH)
+        self.local = LocalStorageBackend(self.shard_depth)
+        self._s3: Optional[S3StorageBackend] = None
+
+        if self.backend_name not in ("local", "s3"):
+            raise ValueError(f"Unknown STORAGE_BACKEND: {self.backend_name}")
+
+    @property
+    def s3(self) -> S3StorageBackend:
+        if self._s3 is None:
+            self._s3 = S3StorageBackend(self.shard_depth)
+        return self._s3
+
+    @property
+    def backend(self) -> StorageBackend:
+        return self.s3 if self.backend_name == "s3" else self.local
+
+    def _backend_for(self, location: str) -> StorageBackend:
+        return self.s3 if location.startswith(S3_SCHEME) else self.local
+
+    def new_location(self, image_type: str, filename: str) -> str:
+        """Location untuk file baru di backend aktif"""
+        return self.backend.location_for(image_type, filename)
+
+    def content_location(self, image_type: str, checksum: str) -> str:
+        """Location content-addressed (nama file = SHA-256 isi file)"""
+        return self.new_location(image_type, f"{checksum}.jpg")
+
+    @staticmethod
+    def content_checksum(location: str) -> Optional[str]:
+        """
+        Checksum dari location content-addressed (kebalikan content_location)
+        Returns: SHA-256 hex, atau None untuk file lama yang namanya bukan checksum
+        """
+        stem, ext = os.path.splitext(location.rsplit("/", 1)[-1])
+        if ext == ".jpg" and len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+            return stem
+        return None
+
+    async def save_stream_content_addressed(
+        self,
+        image_type: str,
+        chunks: AsyncIterator[bytes],
+        max_bytes: int
+    ) -> Tuple[str, int, int, str, int]:
+        """
+        Simpan upload yang di-stream ke location content-addressed
+        Stream ditulis ke staging lokal dulu (checksum baru diketahui di akhir stream);
+        jika isi yang sama sudah tersimpan, staging dibuang dan file lama dipakai
+        
+        Returns: (location, width, height, checksum, size_bytes)
+        """
+        staging_path = os.path.join(settings.STORAGE_PATH, "staging", f"{uuid.uuid4().hex}.jpg")
+        try:
+            # Probe dimensi bisa gagal setelah file staging selesai ditulis
+            width, height, checksum, size = await save_image_stream(chunks, staging_path, max_bytes=max_bytes)
+            
+            location = self.content_location(image_type, checksum)
+            if not await self.backend.exists(location):
+                await self.backend.put_file(staging_path, location)
+        finally:
+            await remove_file_async(staging_path)
+        
+        return location, width, height, checksum, size
+
+    async def save_content_addressed(self, image_type: str, data: bytes, checksum: str) -> str:
+        """
+        Simpan bytes ke location content-addressed (skip jika sudah ada)
+        Returns: location
+        """
+        location = self.content_location(image_type, checksum)
+        if not await self.backend.exists(location):
+            await self.backend.save(location, data)
+        return location
+
+    async def save(self, location: str, data: bytes):
+        await self._backend_for(location).save(location, data)
+
+    async def load(self, location: str) -> bytes:
+        return await self._backend_for(location).load(location)
+
+    async def delete(self, location: str):
+        await self._backend_for(location).delete(location)
+
+    def local_path(self, location: str):
+        """async context manager → path file lokal (S3: diunduh ke file sementara)"""
+        return self._backend_for(location).local_path(location)
+
+    def ensure_directories(self):
+        """Buat root directory local backend (dipanggil saat startup)"""
+        for root in self.local.roots.values():
+            ensure_directory_exists(root)
+
+
+storage_service = StorageService()
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+BatchFunction = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class MicroBatcher:
+    """
+    Kumpulkan item dari banyak coroutine selama beberapa milidetik, lalu proses sekaligus
+
+    - Batch dikirim saat jumlah item mencapai max_size atau window_seconds habis
+      (dihitung sejak item pertama masuk batch)
+    - batch_fn menerima list item dan harus mengembalikan list hasil dengan urutan sama
+    - Setiap pemanggil submit() menerima hasil untuk item miliknya sendiri;
+      hasil berupa instance Exception di-raise ke pemanggil item tersebut
+    - Jika batch_fn raise, semua pemanggil di batch tersebut menerima exception yang sama
+    """
+
+    def __init__(self, batch_fn: BatchFunction, max_size: int, window_seconds: float):
+        self.batch_fn = batch_fn
+        self.max_size = max(1, max_size)
+        self.window_seconds = window_seconds
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Counters untuk monitoring
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Masukkan item ke batch berikutnya dan tunggu hasilnya"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        # Item yang pemanggilnya sudah di-cancel tidak perlu dikirim
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_size": self.max_size,
+            "window_ms": self.window_seconds * 1000,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "max_batch_seen": self.max_batch_seen,
+        }
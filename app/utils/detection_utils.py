@@ -0,0 +1,121 @@
+"""
+Object detection lokal dengan OpenCV DNN (model ONNX hasil export YOLO)
+
+Dijalankan di proses worker (lihat LocalDnnBackend):
+- Model di-load sekali per thread lalu di-cache: cv2.dnn.Net tidak thread-safe,
+  dan fallback tanpa pool menjalankan detect_objects di thread asyncio.to_thread
+- File model diganti (ukuran / mtime berubah) → model di-load ulang di call berikutnya,
+  sama dengan model_key LocalDnnBackend yang memisahkan cache hasil inference
+- Output dibentuk seperti Roboflow Detection API ({"predictions": [...]})
+  agar parse_prediction tidak perlu diubah
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+
+# Per thread: {model_path: (versi file, net)}
+_local = threading.local()
+
+
+def init_detection_worker(opencv_threads: int, model_path: str):
+    """Initializer proses worker: batasi thread OpenCV & load model di awal"""
+    cv2.setNumThreads(opencv_threads)
+    load_dnn_model(model_path)
+
+
+def load_dnn_model(model_path: str):
+    """Load model ONNX ke cv2.dnn (cache per thread, load ulang jika file berubah)"""
+    stat = os.stat(model_path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    nets = getattr(_local, "nets", None)
+    if nets is None:
+        nets = _local.nets = {}
+
+    cached = nets.get(model_path)
+    if cached is None or cached[0] != version:
+        nets[model_path] = (version, cv2.dnn.readNet(model_path))
+    return nets[model_path][1]
+
+
+def decode_yolo_output(output: np.ndarray, class_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode output YOLO menjadi (boxes cx/cy/w/h, score, class_id)
+
+    Mendukung dua layout export:
+    - YOLOv8: (1, 4 + classes, N) - tanpa objectness
+    - YOLOv5: (1, N, 5 + classes) - score = objectness x class score
+    """
+    rows = np.squeeze(output, axis=0) if output.ndim == 3 else output
+    if rows.shape[0] in (4 + class_count, 5 + class_count) and rows.shape[1] not in (4 + class_count, 5 + class_count):
+        rows = rows.T
+
+    if rows.shape[1] == 4 + class_count:
+        class_scores = rows[:, 4:]
+    elif rows.shape[1] == 5 + class_count:
+        class_scores = rows[:, 5:] * rows[:, 4:5]
+    else:
+        raise ValueError(f"Unsupported model output shape {output.shape} for {class_count} classes")
+
+    class_ids = np.argmax(class_scores, axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+    return rows[:, :4], scores, class_ids
+
+
+def detect_objects(
+    image_data: bytes,
+    model_path: str,
+    class_names: List[str],
+    input_size: int = 640,
+    confidence: float = 0.4,
+    nms_threshold: float = 0.3
+) -> Dict[str, Any]:
+    """
+    Jalankan model pada image bytes
+    Returns: {"image": {...}, "predictions": [{"x", "y", "width", "height", "confidence", "class", "class_id"}]}
+    (koordinat center box dalam pixel image asli, seperti Roboflow Detection API)
+    """
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image data")
+    height, width = image.shape[:2]
+
+    net = load_dnn_model(model_path)
+    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (input_size, input_size), swapRB=True, crop=False)
+    net.setInput(blob)
+    output = net.forward()
+
+    boxes, scores, class_ids = decode_yolo_output(output, len(class_names))
+    keep = scores >= confidence
+    boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+
+    scale_x = width / input_size
+    scale_y = height / input_size
+    rects = [
+        [float((cx - w / 2) * scale_x), float((cy - h / 2) * scale_y), float(w * scale_x), float(h * scale_y)]
+        for cx, cy, w, h in boxes
+    ]
+    indices = cv2.dnn.NMSBoxes(rects, scores.astype(float).tolist(), confidence, nms_threshold) if rects else []
+
+    predictions = []
+    for i in np.array(indices).flatten():
+        left, top, box_width, box_height = rects[i]
+        class_id = int(class_ids[i])
+        predictions.append({
+            "x": round(left + box_width / 2, 1),
+            "y": round(top + box_height / 2, 1),
+            "width": round(box_width, 1),
+            "height": round(box_height, 1),
+            "confidence": round(float(scores[i]), 4),
+            "class": class_names[class_id],
+            "class_id": class_id,
+        })
+
+    return {
+        "image": {"width": width, "height": height},
+        "predictions": predictions,
+    }
@@ -1,8 +1,10 @@
+import asyncio
+import io
 import os
 import hashlib
 from datetime import datetime
 from PIL import Image
-from typing import Tuple, Optional
+from typing import AsyncIterator, Tuple, Optional
 import numpy as np
 import cv2
 from app.config import get_current_time
@@ -131,24 +133,176 @@ def enhance_larvae_visibility(
     return gray
 
 
-def save_image(image_data: bytes, file_path: str) -> Tuple[int, int, str]:
+# Marker SOF (Start Of Frame) JPEG yang berisi dimensi: C0-CF kecuali DHT (C4), JPG (C8), DAC (CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def probe_jpeg_dimensions(image_data: bytes) -> Optional[Tuple[int, int]]:
     """
-    Save image to filesystem
-    Returns: (width, height, checksum)
+    Baca (width, height) dari header JPEG tanpa decode pixel
+    Scan segment marker sampai ketemu SOF
+    Returns None jika bukan JPEG atau header tidak valid
     """
-    # Ensure directory exists
-    directory = os.path.dirname(file_path)
-    ensure_directory_exists(directory)
+    size = len(image_data)
+    if size < 4 or image_data[0] != 0xFF or image_data[1] != 0xD8:
+        return None
     
-    # Save image
+    i = 2
+    while i + 9 < size:
+        if image_data[i] != 0xFF:
+            return None
+        marker = image_data[i + 1]
+        
+        # Fill byte / marker tanpa payload
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(image_data[i + 5:i + 7], "big")
+            width = int.from_bytes(image_data[i + 7:i + 9], "big")
+            return width, height
+        
+        length = int.from_bytes(image_data[i + 2:i + 4], "big")
+        i += 2 + length
+    
+    return None
+
+
+def probe_image_dimensions(image_data: bytes) -> Tuple[int, int]:
+    """
+    Dimensi image dari header saja
+    JPEG di-parse langsung, format lain lewat PIL (lazy, hanya baca header)
+    """
+    dimensions = probe_jpeg_dimensions(image_data)
+    if dimensions:
+        return dimensions
+    
+    with Image.open(io.BytesIO(image_data)) as img:
+        return img.size
+
+
+def write_file(file_path: str, data: bytes):
+    """Tulis bytes ke file, buat directory jika belum ada"""
+    ensure_directory_exists(os.path.dirname(file_path))
     with open(file_path, 'wb') as f:
-        f.write(image_data)
+        f.write(data)
+
+
+def read_file(file_path: str) -> bytes:
+    """Baca file sebagai bytes"""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def file_checksum(file_path: str, chunk_size: int = 65536) -> str:
+    """SHA-256 isi file (dibaca per chunk)"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class UploadTooLargeError(ValueError):
+    """Upload melebihi batas ukuran (UPLOAD_MAX_BYTES)"""
+    pass
+
+
+async def save_image_stream(
+    chunks: AsyncIterator[bytes],
+    file_path: str,
+    max_bytes: int,
+    header_size: int = 65536
+) -> Tuple[int, int, str, int]:
+    """
+    Simpan image dari stream chunk ke file tanpa menampung seluruh isi di memory
+    
+    - SHA-256 dihitung bertahap per chunk
+    - Ditulis ke file .part lalu di-rename (file final tidak pernah setengah jadi)
+    - Raise UploadTooLargeError begitu total melebihi max_bytes
+    - Dimensi dibaca dari header (chunk awal), fallback baca header file via PIL
+    
+    Returns: (width, height, checksum, size_bytes)
+    """
+    ensure_directory_exists(os.path.dirname(file_path))
+    temp_path = f"{file_path}.part"
+    
+    hasher = hashlib.sha256()
+    header = bytearray()
+    size = 0
+    
+    f = await asyncio.to_thread(open, temp_path, 'wb')
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"Image exceeds maximum size of {max_bytes} bytes")
+            hasher.update(chunk)
+            if len(header) < header_size:
+                header.extend(chunk[:header_size - len(header)])
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(_remove_quietly, temp_path)
+        raise
+    
+    await asyncio.to_thread(f.close)
+    
+    if size == 0:
+        await asyncio.to_thread(_remove_quietly, temp_path)
+        raise ValueError("Empty image upload")
     
-    # Get image dimensions
+    await asyncio.to_thread(os.replace, temp_path, file_path)
+    
+    dimensions = probe_jpeg_dimensions(bytes(header))
+    if not dimensions:
+        dimensions = await asyncio.to_thread(_probe_file_dimensions, file_path)
+    
+    return dimensions[0], dimensions[1], hasher.hexdigest(), size
+
+
+def _probe_file_dimensions(file_path: str) -> Tuple[int, int]:
+    """Dimensi dari header file (PIL lazy, tidak decode pixel)"""
     with Image.open(file_path) as img:
-        width, height = img.size
+        return img.size
+
+
+def _remove_quietly(file_path: str):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+async def remove_file_async(file_path: str):
+    """Hapus file tanpa error jika sudah tidak ada"""
+    await asyncio.to_thread(_remove_quietly, file_path)
+
+
+async def iter_upload_file(upload_file, chunk_size: int) -> AsyncIterator[bytes]:
+    """Baca UploadFile per chunk (UploadFile sudah di-spool starlette ke disk jika besar)"""
+    while True:
+        chunk = await upload_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def save_image(image_data: bytes, file_path: str) -> Tuple[int, int, str]:
+    """
+    Save image to filesystem
+    File ditulis sekali; dimensi dibaca dari header (tanpa buka ulang file)
+    Returns: (width, height, checksum)
+    """
+    write_file(file_path, image_data)
     
-    # Calculate checksum
+    width, height = probe_image_dimensions(image_data)
     checksum = hashlib.sha256(image_data).hexdigest()
     
     return width, height, checksum
@@ -196,14 +350,52 @@ def preprocess_image(
     
     Returns: (width, height, checksum, image_data)
     """
-    # Ensure output directory exists
-    directory = os.path.dirname(output_path)
-    ensure_directory_exists(directory)
+    # Decode/encode di memory, file output ditulis sekali (tanpa baca ulang)
+    width, height, checksum, image_data = preprocess_image_data(
+        read_file(input_path),
+        enhance_for_larvae=enhance_for_larvae,
+        apply_denoise=apply_denoise,
+        apply_clahe_enhancement=apply_clahe_enhancement,
+        apply_sharp=apply_sharp,
+        apply_morphology=apply_morphology,
+        denoise_strength=denoise_strength,
+        clahe_clip_limit=clahe_clip_limit,
+        sharpening_method=sharpening_method,
+        morph_operation=morph_operation,
+        morph_iterations=morph_iterations,
+        save_as_grayscale=save_as_grayscale
+    )
+    write_file(output_path, image_data)
     
-    # Read image dengan OpenCV
-    image = cv2.imread(input_path)
+    return width, height, checksum, image_data
+
+
+def preprocess_image_data(
+    image_data: bytes,
+    enhance_for_larvae: bool = True,
+    apply_denoise: bool = True,
+    apply_clahe_enhancement: bool = True,
+    apply_sharp: bool = True,
+    apply_morphology: bool = False,
+    denoise_strength: int = 10,
+    clahe_clip_limit: float = 2.5,
+    sharpening_method: str = "unsharp",
+    morph_operation: str = "dilate",
+    morph_iterations: int = 1,
+    save_as_grayscale: bool = False
+) -> Tuple[int, int, str, bytes]:
+    """
+    Versi bytes-in/bytes-out dari preprocess_image (tanpa akses disk)
+    Dipakai di process pool: hanya bytes yang dikirim antar proses, bukan path
+    
+    Pipeline dan parameter sama dengan preprocess_image.
+    
+    Returns: (width, height, checksum, image_data) dari JPEG hasil preprocessing
+    """
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
     if image is None:
-        raise ValueError(f"Could not read image from {input_path}")
+        raise ValueError("Could not decode image data")
     
     # Resize if too large (max 1024x1024) - penting untuk performa
     max_size = 1024
@@ -215,7 +407,6 @@ def preprocess_image(
         image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
     
     if enhance_for_larvae:
-        # Apply full larvae enhancement pipeline
         enhanced = enhance_larvae_visibility(
             image,
             apply_denoise=apply_denoise,
@@ -228,34 +419,48 @@ def preprocess_image(
             morph_operation=morph_operation,
             morph_iterations=morph_iterations
         )
-        
-        if save_as_grayscale:
-            # Simpan sebagai grayscale
-            output_image = enhanced
-        else:
-            # Convert kembali ke RGB (3 channel) untuk kompatibilitas
-            output_image = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
+        output_image = enhanced if save_as_grayscale else cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
     else:
-        # Tanpa enhancement, hanya resize
         output_image = image
     
-    # Save preprocessed image
-    cv2.imwrite(output_path, output_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
-    
-    # Get final dimensions
-    if len(output_image.shape) == 2:
-        height, width = output_image.shape
-    else:
-        height, width = output_image.shape[:2]
+    ok, encoded = cv2.imencode(".jpg", output_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise ValueError("Could not encode preprocessed image")
     
-    # Read image data for blob storage
-    with open(output_path, 'rb') as f:
-        image_data = f.read()
+    output_data = encoded.tobytes()
+    height, width = output_image.shape[:2]
+    checksum = hashlib.sha256(output_data).hexdigest()
     
-    # Calculate checksum
-    checksum = hashlib.sha256(image_data).hexdigest()
+    return width, height, checksum, output_data
+
+
+def compute_dhash(gray: np.ndarray, hash_size: int = 8) -> str:
+    """
+    Difference hash (dHash) dari image grayscale
+    Resize ke (hash_size+1) x hash_size, bandingkan pixel bertetangga → hash_size² bit
     
-    return width, height, checksum, image_data
+    Returns: hash hex (16 karakter untuk hash_size=8)
+    """
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = resized[:, 1:] > resized[:, :-1]
+    return np.packbits(diff.flatten()).tobytes().hex()
+
+
+def perceptual_hash_image_data(image_data: bytes, hash_size: int = 8) -> str:
+    """
+    Perceptual hash dari bytes JPEG
+    Decode langsung ke grayscale 1/4 resolusi (libjpeg DCT scaling) - jauh lebih murah dari decode penuh
+    """
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    gray = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        raise ValueError("Could not decode image data")
+    return compute_dhash(gray, hash_size)
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """Jumlah bit berbeda antara dua hash hex"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
 
 
 def generate_image_filename(device_code: str, image_type: str = "original") -> str:
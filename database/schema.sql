@@ -52,10 +52,16 @@ CREATE TABLE IF NOT EXISTS images (
     checksum VARCHAR(64),
     captured_at TIMESTAMP NULL,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    source_image_id CHAR(36) NULL,
+    duplicate_of_id CHAR(36) NULL,
+    perceptual_hash VARCHAR(16) NULL,
     INDEX idx_device_code (device_code),
     INDEX idx_device_id (device_id),
     INDEX idx_uploaded_at (uploaded_at),
-    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE
+    INDEX idx_images_checksum (checksum, device_id),
+    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
+    FOREIGN KEY (source_image_id) REFERENCES images(id) ON DELETE SET NULL,
+    FOREIGN KEY (duplicate_of_id) REFERENCES images(id) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ============================================================
@@ -75,12 +81,16 @@ CREATE TABLE IF NOT EXISTS inference_results (
     parsing_version VARCHAR(50),
     status VARCHAR(50),
     error_message TEXT,
+    reused_from_id CHAR(36) NULL,
+    reuse_reason VARCHAR(50) NULL,
+    UNIQUE KEY uq_inference_results_image_id (image_id),
     INDEX idx_device_code (device_code),
     INDEX idx_device_id (device_id),
     INDEX idx_inference_at (inference_at),
     INDEX idx_status (status),
     FOREIGN KEY (image_id) REFERENCES images(id) ON DELETE CASCADE,
-    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE
+    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
+    FOREIGN KEY (reused_from_id) REFERENCES inference_results(id) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ============================================================
@@ -119,6 +129,99 @@ CREATE TABLE device_controls (
     FOREIGN KEY (device_code) REFERENCES devices(device_code) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- ============================================================
+-- Table: inference_jobs (durable inference queue)
+-- ============================================================
+-- Ditulis bersama baris images dalam satu transaksi,
+-- di-claim worker dengan SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8+)
+CREATE TABLE IF NOT EXISTS inference_jobs (
+    id CHAR(36) PRIMARY KEY,
+    image_id CHAR(36) NOT NULL,
+    device_id CHAR(36) NOT NULL,
+    device_code VARCHAR(255) NOT NULL,
+    preprocessed_image_path VARCHAR(500),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    available_at DATETIME NOT NULL,
+    lease_expires_at DATETIME NULL,
+    locked_by VARCHAR(100),
+    last_error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_inference_jobs_claim (status, available_at),
+    INDEX idx_image_id (image_id),
+    INDEX idx_device_code (device_code),
+    FOREIGN KEY (image_id) REFERENCES images(id) ON DELETE CASCADE,
+    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- Table: idempotency_keys (replay upload ESP32)
+-- ============================================================
+-- Ditulis bersama baris images dalam satu transaksi
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    id CHAR(36) PRIMARY KEY,
+    device_id CHAR(36) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    image_id CHAR(36) NULL,
+    response JSON NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_idempotency_device_key (device_id, idempotency_key),
+    INDEX idx_idempotency_created_at (created_at),
+    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
+    FOREIGN KEY (image_id) REFERENCES images(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- Table: blynk_outbox (write virtual pin Blynk, coalesced)
+-- ============================================================
+-- Satu baris per pin dashboard (dipakai bersama semua device), hanya value terakhir yang dikirim flusher
+CREATE TABLE IF NOT EXISTS blynk_outbox (
+    id CHAR(36) PRIMARY KEY,
+    device_code VARCHAR(255) NOT NULL,
+    pin VARCHAR(10) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    sent_value VARCHAR(255) NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME NOT NULL,
+    last_error TEXT,
+    sent_at DATETIME NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_blynk_outbox_pin (pin),
+    INDEX idx_blynk_outbox_pending (status, available_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- Migrasi database lama: dedup content-addressed
+-- ============================================================
+-- ALTER TABLE images
+--     ADD COLUMN source_image_id CHAR(36) NULL,
+--     ADD COLUMN duplicate_of_id CHAR(36) NULL,
+--     ADD INDEX idx_images_checksum (checksum, device_id),
+--     ADD FOREIGN KEY (source_image_id) REFERENCES images(id) ON DELETE SET NULL,
+--     ADD FOREIGN KEY (duplicate_of_id) REFERENCES images(id) ON DELETE SET NULL;
+-- ALTER TABLE inference_results
+--     ADD COLUMN reused_from_id CHAR(36) NULL,
+--     ADD FOREIGN KEY (reused_from_id) REFERENCES inference_results(id) ON DELETE SET NULL;
+
+-- Migrasi database lama: scene-change gate (perceptual hash)
+-- ALTER TABLE images ADD COLUMN perceptual_hash VARCHAR(16) NULL;
+-- ALTER TABLE inference_results ADD COLUMN reuse_reason VARCHAR(50) NULL;
+
+-- Migrasi database lama: retensi idempotency key (purge berdasarkan created_at)
+-- ALTER TABLE idempotency_keys ADD INDEX idx_idempotency_created_at (created_at);
+
+-- Migrasi database lama: blynk_outbox satu baris per pin (value pending lama dibuang,
+-- dashboard terisi lagi dari inference berikutnya)
+-- DELETE FROM blynk_outbox;
+-- ALTER TABLE blynk_outbox DROP INDEX uq_blynk_outbox_device_pin, ADD UNIQUE KEY uq_blynk_outbox_pin (pin);
+
+-- Migrasi database lama: satu inference result per frame
+-- (hapus dulu baris duplikat per image_id jika ada)
+-- ALTER TABLE inference_results ADD UNIQUE KEY uq_inference_results_image_id (image_id);
+
 -- ============================================================
 -- Selesai
 -- ============================================================
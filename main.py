@@ -1,11 +1,21 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 from fastapi.openapi.utils import get_openapi
-from app.api.endpoints import router
+from app.api.endpoints import router, process_inference_background, record_inference_failure
 from app.database import init_db
 from app.config import settings
 from app.auth import verify_docs_api_key
+from app.services.inference_scheduler import inference_scheduler
+from app.services.preprocessing_service import preprocessing_pool
+from app.services.roboflow_service import roboflow_service
+from app.services.blynk_outbox import blynk_outbox
+from app.services.blynk_service import blynk_service
+from app.services.decision_events import register_decision_subscribers
+from app.services.event_bus import event_bus
+from app.services.notification_aggregator import notification_aggregator
+from app.services.storage_service import storage_service
 import os
 
 # Initialize FastAPI app with docs disabled (will be protected manually)
@@ -27,6 +37,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """
+    Tolak upload yang Content-Length-nya melebihi batas sebelum body dibaca/di-parse
+    Upload tanpa Content-Length (chunked) tetap dibatasi saat streaming ke disk
+    """
+    if request.method == "POST" and request.url.path.startswith("/api/upload"):
+        content_length = request.headers.get("content-length")
+        # Sisakan ruang untuk overhead multipart (boundary, header part, field lain)
+        frames = settings.UPLOAD_BATCH_MAX_FRAMES if request.url.path == "/api/upload/batch" else 1
+        max_length = frames * (settings.UPLOAD_MAX_BYTES + 64 * 1024)
+        if content_length and content_length.isdigit() and int(content_length) > max_length:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds maximum size of {max_length} bytes"}
+            )
+    return await call_next(request)
+
+
 # Include routers
 app.include_router(router, prefix="/api", tags=["main"])
 
@@ -39,14 +68,34 @@ async def startup_event():
     
     # Ensure storage directories exist
     os.makedirs(settings.STORAGE_PATH, exist_ok=True)
-    os.makedirs(settings.IMAGE_ORIGINAL_PATH, exist_ok=True)
-    os.makedirs(settings.IMAGE_PREPROCESSED_PATH, exist_ok=True)
+    storage_service.ensure_directories()
+    
+    # Start preprocessing process pool & inference worker pool
+    preprocessing_pool.start()
+    await roboflow_service.start()
+    await blynk_service.start()
+    await blynk_outbox.start()
+    register_decision_subscribers(event_bus)
+    await event_bus.start()
+    await inference_scheduler.start(process_inference_background, record_inference_failure)
     
     print("✓ Database initialized")
-    print("✓ Storage directories created")
+    print(f"✓ Storage ready (backend: {storage_service.backend_name})")
     print(f"✓ Server starting on {settings.API_HOST}:{settings.API_PORT}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain inference queue sebelum proses berhenti"""
+    await inference_scheduler.stop()
+    await roboflow_service.stop()
+    await event_bus.stop()
+    await blynk_outbox.stop()
+    await notification_aggregator.stop()
+    await blynk_service.stop()
+    preprocessing_pool.stop()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
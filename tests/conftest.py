@@ -0,0 +1,25 @@
+"""
+Konfigurasi test: database sqlite sementara (tanpa MySQL), dibuat sebelum app di-import
+"""
+
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="larva-test-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.sqlite')}")
+os.environ.setdefault("BLYNK_AUTH_TOKEN", "test-token")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.dialects.mysql import LONGBLOB  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+
+
+@compiles(LONGBLOB, "sqlite")
+def _compile_longblob_sqlite(type_, compiler, **kw):
+    return "BLOB"
+
+
+from app.database import init_db  # noqa: E402
+
+init_db()
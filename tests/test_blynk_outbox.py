@@ -0,0 +1,84 @@
+import asyncio
+
+from sqlalchemy import delete
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models.blynk_outbox import BlynkOutbox
+from app.services.blynk_outbox import BlynkOutboxService
+from app.services.blynk_service import blynk_service
+
+
+def run(coro):
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(wrapper())
+
+
+def test_devices_alternating_on_shared_pin_always_push_latest(monkeypatch):
+    pushed = []
+
+    async def fake_update_pins(pins):
+        pushed.append(dict(pins))
+        return True
+
+    monkeypatch.setattr(blynk_service, "update_pins", fake_update_pins)
+    outbox = BlynkOutboxService()
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(BlynkOutbox))
+            await db.commit()
+
+        for device_code, status in [("A", "BAHAYA"), ("B", "AMAN"), ("A", "BAHAYA"), ("A", "BAHAYA")]:
+            async with AsyncSessionLocal() as db:
+                await outbox.enqueue(db, device_code, {blynk_service.STATUS_PIN: status})
+                await db.commit()
+            await outbox.flush_once()
+
+    run(scenario())
+
+    # Ketiga write pertama mengubah dashboard; write keempat sama dengan value yang tampil
+    assert pushed == [{"V0": "BAHAYA"}, {"V0": "AMAN"}, {"V0": "BAHAYA"}]
+    assert outbox.skipped == 1
+
+
+def test_failed_write_is_not_retried_after_newer_write_from_other_device(monkeypatch):
+    pushed = []
+    blynk_up = False
+
+    async def fake_update_pins(pins):
+        if not blynk_up:
+            return False
+        pushed.append(dict(pins))
+        return True
+
+    monkeypatch.setattr(blynk_service, "update_pins", fake_update_pins)
+    outbox = BlynkOutboxService()
+    outbox.retry_base_seconds = 0
+
+    async def scenario():
+        nonlocal blynk_up
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(BlynkOutbox))
+            await db.commit()
+
+        # A gagal terkirim dan dijadwalkan retry
+        async with AsyncSessionLocal() as db:
+            await outbox.enqueue(db, "A", {blynk_service.LARVA_COUNT_PIN: 12})
+            await db.commit()
+        await outbox.flush_once()
+
+        # B menulis value lebih baru ke pin yang sama, Blynk sudah pulih
+        blynk_up = True
+        async with AsyncSessionLocal() as db:
+            await outbox.enqueue(db, "B", {blynk_service.LARVA_COUNT_PIN: 0})
+            await db.commit()
+        await outbox.flush_once()
+        await outbox.flush_once()
+
+    run(scenario())
+
+    assert pushed == [{blynk_service.LARVA_COUNT_PIN: "0"}]
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from app.services.inference_cache import InferenceCache
+
+
+def test_follower_wait_is_bounded_by_its_timeout():
+    cache = InferenceCache()
+    cache.ttl_seconds = 60
+    cache.disk_dir = None
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_compute():
+            await release.wait()
+            return {"predictions": []}
+
+        leader = asyncio.create_task(cache.get_or_compute("k", slow_compute))
+        await asyncio.sleep(0)
+        with pytest.raises(TimeoutError):
+            await cache.get_or_compute("k", slow_compute, timeout=0.05)
+
+        # Request milik leader tidak ikut dibatalkan
+        release.set()
+        return await leader
+
+    assert asyncio.run(scenario()) == {"predictions": []}
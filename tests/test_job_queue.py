@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from sqlalchemy import delete
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models.inference_job import InferenceJob
+from app.services.job_queue import InferenceJobQueue, LeaseLostError
+
+
+def run(coro):
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(wrapper())
+
+
+async def enqueue_job(queue: InferenceJobQueue) -> str:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(InferenceJob))
+        job = queue.enqueue(db, "image-1", "device-1", "A")
+        await db.commit()
+        return job.id
+
+
+def test_worker_cannot_complete_job_after_lease_is_reclaimed():
+    queue = InferenceJobQueue()
+    # Lease langsung expired: worker kedua boleh claim ulang
+    queue.lease_seconds = -1
+
+    async def scenario():
+        job_id = await enqueue_job(queue)
+        async with AsyncSessionLocal() as db:
+            stale = await queue.claim(db, "w1", job_id)
+        async with AsyncSessionLocal() as db:
+            current = await queue.claim(db, "w2", job_id)
+        assert current.attempts == 2
+
+        async with AsyncSessionLocal() as db:
+            with pytest.raises(LeaseLostError):
+                await queue.complete(db, stale)
+            with pytest.raises(LeaseLostError):
+                await queue.renew_lease(db, stale)
+            await queue.complete(db, current)
+
+        async with AsyncSessionLocal() as db:
+            job = await db.get(InferenceJob, job_id)
+            return job.status, job.locked_by
+
+    assert run(scenario()) == ("done", "w2")
+
+
+def test_expired_job_on_last_attempt_is_dead_lettered_not_reclaimed():
+    queue = InferenceJobQueue()
+    queue.lease_seconds = -1
+    queue.max_attempts = 1
+
+    async def scenario():
+        job_id = await enqueue_job(queue)
+        async with AsyncSessionLocal() as db:
+            assert await queue.claim(db, "w1", job_id) is not None
+        async with AsyncSessionLocal() as db:
+            assert await queue.claim(db, "w2", job_id) is None
+        async with AsyncSessionLocal() as db:
+            reaped = await queue.reap_expired(db)
+        async with AsyncSessionLocal() as db:
+            job = await db.get(InferenceJob, job_id)
+            return [r.id for r in reaped] == [job_id], job.status
+
+    assert run(scenario()) == (True, "dead")
@@ -0,0 +1,59 @@
+import asyncio
+
+from app.services.blynk_service import blynk_service
+from app.services.notification_aggregator import NotificationAggregator
+
+
+def test_event_added_during_send_is_flushed_in_next_window(monkeypatch):
+    messages = []
+    aggregator = NotificationAggregator()
+    aggregator.window_seconds = 0.01
+    aggregator.device_min_interval = 0
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_send(message):
+            messages.append(message)
+            if len(messages) == 1:
+                # Event baru masuk saat digest pertama masih dikirim
+                aggregator.add("B", 7)
+                await release.wait()
+            return True
+
+        monkeypatch.setattr(blynk_service, "send_notification", slow_send)
+        aggregator.add("A", 5)
+        await asyncio.sleep(0.05)
+        release.set()
+
+        for _ in range(100):
+            if len(messages) == 2:
+                break
+            await asyncio.sleep(0.01)
+        task = aggregator._task
+        if task is not None:
+            await task
+
+    asyncio.run(scenario())
+
+    assert len(messages) == 2
+    assert "di A!" in messages[0] and "di B!" in messages[1]
+    assert aggregator.stats()["pending_devices"] == 0
+    assert aggregator._task is None
+
+
+def test_failed_send_does_not_use_hourly_quota(monkeypatch):
+    aggregator = NotificationAggregator()
+
+    async def failing_send(message):
+        return False
+
+    monkeypatch.setattr(blynk_service, "send_notification", failing_send)
+
+    async def scenario():
+        aggregator._pending = {"A": {"larva_count": 5, "events": 1}}
+        return await aggregator.flush()
+
+    assert asyncio.run(scenario()) is False
+    assert aggregator.digests_failed == 1
+    assert aggregator.stats()["sent_last_hour"] == 0